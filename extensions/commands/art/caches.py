@@ -0,0 +1,215 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from conan.api.output import ConanOutput
+
+CACHE_FOLDER = "art_cache"
+
+
+class _SqliteStore:
+    """
+    Small key-value store on a SQLite database inside the Conan home, with entries grouped by
+    a ``scope`` and evicted in LRU order when the total size goes over ``max_size`` bytes.
+    It can be shared between threads and between concurrent Conan processes.
+
+    New entries and the last use time of the hits are buffered and written in a single transaction
+    every ``_write_batch`` entries and on ``close()``. The total size is kept as a running count and only recomputed from the
+    database when it goes over the limit, as entries written by other processes are not counted.
+    """
+
+    _schema = ("CREATE TABLE IF NOT EXISTS entries (scope TEXT NOT NULL, key TEXT NOT NULL, "
+               "value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL, "
+               "PRIMARY KEY (scope, key))",
+               "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+    _write_batch = 500
+
+    def __init__(self, path, max_size):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                           isolation_level=None)
+        self._max_size = max_size
+        self._pending = {}  # (scope, key) -> (value, last_used), not written yet
+        self._used = {}  # (scope, key) -> last_used of the hits, not written yet
+        self.hits = 0
+        self.misses = 0
+        with self._lock:
+            for statement in self._schema:
+                self._connection.execute(statement)
+            self._total_size = self._stored_size()
+
+    def _get(self, scope, key, is_valid=None):
+        """
+        ``is_valid(value)`` can check if the entry is stale, counting it as a miss
+        """
+        with self._lock:
+            pending = self._pending.get((scope, key))
+            if pending is not None:
+                value = pending[0]
+            else:
+                row = self._connection.execute("SELECT value FROM entries WHERE scope=? AND key=?",
+                                               (scope, key)).fetchone()
+                value = row[0] if row is not None else None
+            if value is None or (is_valid is not None and not is_valid(value)):
+                self.misses += 1
+                return None
+            self.hits += 1
+            if pending is None:
+                self._used[(scope, key)] = time.time()
+                if len(self._used) >= self._write_batch:
+                    self._flush()
+            return value
+
+    def _put(self, scope, key, value):
+        with self._lock:
+            self._pending[(scope, key)] = (value, time.time())
+            if len(self._pending) >= self._write_batch:
+                self._flush()
+
+    def _flush(self):
+        if not self._pending and not self._used:
+            return
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._connection.executemany("UPDATE entries SET last_used=? WHERE scope=? AND key=?",
+                                         [(last_used, scope, key)
+                                          for (scope, key), last_used in self._used.items()])
+            self._connection.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                                         [(scope, key, value, len(value), last_used)
+                                          for (scope, key), (value, last_used) in self._pending.items()])
+            # Replaced entries are counted twice, that only makes the exact count happen earlier
+            self._total_size += sum(len(value) for value, _ in self._pending.values())
+            if self._total_size > self._max_size:
+                self._total_size = self._stored_size()
+                self._evict()
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        finally:
+            self._pending.clear()
+            self._used.clear()
+
+    def _stored_size(self):
+        return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self):
+        if self._total_size <= self._max_size:
+            return
+        # Free some room below the limit, so it is not necessary to evict on every insertion
+        to_free = self._total_size - int(self._max_size * 0.9)
+        freed = 0
+        evicted = []
+        for scope, key, size in self._connection.execute("SELECT scope, key, size FROM entries "
+                                                         "ORDER BY last_used"):
+            evicted.append((scope, key))
+            freed += size
+            if freed >= to_free:
+                break
+        self._connection.executemany("DELETE FROM entries WHERE scope=? AND key=?", evicted)
+        self._total_size -= freed
+
+    def invalidate(self, scope=None):
+        with self._lock:
+            if scope is None:
+                self._pending.clear()
+                self._used.clear()
+                self._connection.execute("DELETE FROM entries")
+            else:
+                self._pending = {k: v for k, v in self._pending.items() if k[0] != scope}
+                self._used = {k: v for k, v in self._used.items() if k[0] != scope}
+                self._connection.execute("DELETE FROM entries WHERE scope=?", (scope,))
+            self._total_size = self._stored_size()
+
+    def report(self, name):
+        total = self.hits + self.misses
+        if total:
+            ConanOutput().verbose(f"{name}: {self.hits} hits, {self.misses} misses "
+                                  f"({100 * self.hits / total:.1f}% hit rate)")
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._connection.close()
+
+
+class MetadataCache(_SqliteStore):
+    """
+    Persistent cache of the Artifactory storage information (checksums) of the Conan artifacts.
+    Only fully revisioned paths are cached (``user/name/version/channel/rrev/export/file`` and
+    ``.../rrev/package/pkgid/prev/file``) as those never change. Entries are scoped by server url.
+    """
+
+    def get_checksums(self, server_url, storage_path):
+        value = self._get(server_url.rstrip("/"), storage_path)
+        return json.loads(value) if value is not None else None
+
+    def set_checksums(self, server_url, storage_path, checksums):
+        self._put(server_url.rstrip("/"), storage_path, json.dumps(checksums))
+
+    def invalidate(self, server_url=None):
+        super().invalidate(server_url.rstrip("/") if server_url else None)
+
+
+class ChecksumCache(_SqliteStore):
+    """
+    Persistent cache of the checksums of the files in the Conan cache, so unchanged files do not
+    have to be read and hashed again. Entries are keyed by the file path and are only valid while
+    the size, modification time (ns) and inode of the file are the same, otherwise they are replaced.
+    Files smaller than ``min_size`` bytes are always hashed, as that is faster than looking them up.
+    """
+
+    _scope = "local"
+
+    def __init__(self, path, max_size, min_size=0):
+        super().__init__(path, max_size)
+        self._min_size = min_size
+
+    @staticmethod
+    def _file_id(stat):
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    def get_hashes(self, file_path, compute):
+        """ Cached result of ``compute(file_path)``, the md5, sha1 and sha256 of the file """
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        if stat.st_size < self._min_size:
+            return compute(file_path)
+        file_id = self._file_id(stat)
+        value = self._get(self._scope, file_path, lambda v: json.loads(v)["file"] == file_id)
+        if value is not None:
+            return tuple(json.loads(value)["hashes"])
+        hashes = compute(file_path)
+        self._put(self._scope, file_path, json.dumps({"file": file_id, "hashes": hashes}))
+        return hashes
+
+
+def get_checksum_cache(conan_api):
+    """
+    Returns the ``ChecksumCache`` in the Conan home, or None if disabled with the
+    ``user.art:checksum_cache=False`` conf. Its size is limited by ``user.art:checksum_cache_size``
+    in MB (default 50). Only files of at least ``user.art:checksum_cache_min_size`` KB (default 16)
+    are cached.
+    """
+    if not conan_api.config.get("user.art:checksum_cache", default=True, check_type=bool):
+        return None
+    max_size = conan_api.config.get("user.art:checksum_cache_size", default=50, check_type=int)
+    min_size = conan_api.config.get("user.art:checksum_cache_min_size", default=16, check_type=int)
+    path = os.path.join(conan_api.home_folder, CACHE_FOLDER, "checksums.sqlite")
+    return ChecksumCache(path, max_size * 1024 * 1024, min_size * 1024)
+
+
+def get_metadata_cache(conan_api):
+    """
+    Returns the ``MetadataCache`` in the Conan home, or None if disabled with the
+    ``user.art:metadata_cache=False`` conf. Its size is limited by ``user.art:metadata_cache_size``
+    in MB (default 100).
+    """
+    if not conan_api.config.get("user.art:metadata_cache", default=True, check_type=bool):
+        return None
+    max_size = conan_api.config.get("user.art:metadata_cache_size", default=100, check_type=int)
+    path = os.path.join(conan_api.home_folder, CACHE_FOLDER, "metadata.sqlite")
+    return MetadataCache(path, max_size * 1024 * 1024)
@@ -3,6 +3,7 @@ import json
 import os
 import re
 import hashlib
+import threading
 from pathlib import Path
 from urllib.parse import urlparse
 
@@ -17,9 +18,36 @@ except:
 from conan import conan_version
 from conan.tools.scm import Version
 
-from utils import NotFoundException, api_request, assert_server_or_url_user_password, load_json
-from cmd_property import get_properties, set_properties
+from utils import NotFoundException, RequestExecutor, add_http_arguments, api_request, aql_search, \
+    assert_server_or_url_user_password, configure_http, get_executor, iter_json_file, json_codec, load_json, \
+    profiler, raise_first_error
+from cmd_property import get_properties, get_properties_bulk, set_properties
 from cmd_server import get_url_user_password
+from caches import get_checksum_cache, get_metadata_cache
+
+
+# Conan revision paths in every AQL query of --checksums-from=server
+_AQL_PATHS_PER_QUERY = 100
+
+
+# The only fields of the graph nodes used for the Build Info
+_GRAPH_NODE_FIELDS = ("ref", "id", "recipe", "binary", "package_id", "prev", "package_folder")
+
+
+def _load_graph(json_file):
+    """
+    Loads the nodes of a Conan graph json, reading the file incrementally and keeping only the
+    fields needed for the Build Info (not the settings, options, conf or cpp_info of every node)
+    """
+    nodes = {}
+    for node_id, node in iter_json_file(json_file, "graph", "nodes"):
+        graph_node = {field: node[field] for field in _GRAPH_NODE_FIELDS if field in node}
+        graph_node["dependencies"] = {require_id: {"direct": require.get("direct")}
+                                      for require_id, require in (node.get("dependencies") or {}).items()}
+        nodes[node_id] = graph_node
+    if not nodes:
+        raise ConanException("JSON does not contain graph information")
+    return {"graph": {"nodes": nodes}}
 
 
 def get_buildinfo(build_name, build_number, url, user, password, project=None):
@@ -30,8 +58,7 @@ def get_buildinfo(build_name, build_number, url, user, password, project=None):
     return build_info
 
 
-def _get_remote_path(rrev, package_id=None, prev=None):
-    ref = RecipeReference.loads(rrev)
+def _get_remote_path(ref, package_id=None, prev=None):
     user = ref.user or "_"
     channel = ref.channel or "_"
     rev_path = f"{user}/{ref.name}/{ref.version}/{channel}/{ref.revision}"
@@ -42,6 +69,52 @@ def _get_remote_path(rrev, package_id=None, prev=None):
         return f"{rev_path}/package/{package_id}/{prev}"
 
 
+class _GraphNode:
+    """
+    A node of the graph json with only what the Build Info uses: its reference parsed and its
+    Artifactory paths computed once, and its dependencies as indexes in the node table
+    """
+    __slots__ = ("index", "ref", "binary", "package_id", "prev", "package_folder", "reference",
+                 "package_ref", "recipe_path", "package_path", "export_folder", "dependencies",
+                 "direct_dependencies")
+
+    def __init__(self, index, node):
+        self.index = index
+        self.ref = node.get("ref")
+        self.binary = node.get("binary")
+        self.package_id = node.get("package_id")
+        self.prev = node.get("prev")
+        self.package_folder = node.get("package_folder")
+        self.reference = RecipeReference.loads(self.ref) if self.ref else None
+        self.package_ref = f"{self.ref}:{self.package_id}#{self.prev}"
+        self.recipe_path = _get_remote_path(self.reference) if self.reference else None
+        # None for the skipped binaries
+        self.package_path = _get_remote_path(self.reference, self.package_id, self.prev) \
+            if self.reference and self.package_id and self.prev else None
+        self.export_folder = None  # From the Conan cache, only when needed
+        self.dependencies = ()
+        self.direct_dependencies = ()
+
+
+def _get_node_table(nodes, table=None):
+    """
+    Converts the nodes of the graph json, keyed by string ids, into a list of nodes with integer ids.
+    The nodes of several graphs can be added to the same table, each graph keeping its own edges.
+    """
+    table = [] if table is None else table
+    offset = len(table)
+    table.extend(_GraphNode(offset + index, node) for index, node in enumerate(nodes.values()))
+    indexes = {node_id: offset + index for index, node_id in enumerate(nodes)}
+    for graph_node, node in zip(table[offset:], nodes.values()):
+        dependencies = [(indexes[require_id], require.get("direct"))
+                        for require_id, require in (node.get("dependencies") or {}).items()
+                        if require_id in indexes]
+        graph_node.dependencies = tuple(index for index, _ in dependencies)
+        # Conan graph json has it as a boolean, older versions as a string
+        graph_node.direct_dependencies = tuple(index for index, direct in dependencies if direct in (True, "True"))
+    return table
+
+
 def _get_hashes(file_path):
     buf_size = 65536
 
@@ -57,6 +130,7 @@ def _get_hashes(file_path):
             md5.update(data)
             sha1.update(data)
             sha256.update(data)
+            profiler.count("hashed_bytes", len(data))
     return md5.hexdigest(), sha1.hexdigest(), sha256.hexdigest()
 
 
@@ -76,47 +150,84 @@ def _get_formatted_time():
     return formatted_time
 
 
-def _get_requested_by(nodes, node_id, artifact_type):
-
-    node_id = str(node_id)
-    root_direct = []
-    root_node_id = "1"
-    requested_by_ids = []
-
-    for id, node in nodes["1"].get("dependencies").items():
-        if node.get("direct") == "True":
-            root_direct.append(id)
+class _RequestedBy:
+    """
+    Reverse dependency index of the graph, built once, to compute the ``requestedBy`` of the
+    dependencies: every path of direct requirements from the node that requires it up to the root of
+    the graph, as lists of references. Paths are memoized per node, and the results per node and
+    artifact type. To keep the Build Info size bounded in graphs with many diamonds, only the first
+    ``max_paths`` paths of a node are kept (``user.art:requested_by_max_paths`` conf).
+    """
 
-    if node_id in root_direct:
-        requested_by_ids.append([root_node_id])
-    else:
-        for direct_id in root_direct:
-            direct_node = nodes.get(direct_id)
-            all_requested_by = []
-            if node_id in direct_node.get("dependencies"):
-                sublist = list(nodes.get(direct_id).get("dependencies").keys())
-                sublist.reverse()
-                all_requested_by = sublist + [direct_id, root_node_id]
-            if all_requested_by:
-                requested_by_ids.append(all_requested_by)
-
-    ret = []
-    for nodes_ids in requested_by_ids:
-        ref_list = []
-        for node_id in nodes_ids:
-            node = nodes.get(node_id)
-            pkg = f":{node.get('package_id')}#{node.get('prev')}" if artifact_type == "package" else ""
-            ref_list.append(f"{node.get('ref')}{pkg}")
-        ret.append(ref_list)
-    return ret
+    def __init__(self, table, max_paths=100):
+        self._table = table
+        self._max_paths = max_paths
+        self._parents = [[] for _ in table]
+        for node in table:
+            for require_index in node.direct_dependencies:
+                self._parents[require_index].append(node.index)
+        self._paths = {}
+        self._truncated = set()
+        self._reported = set()
+        self._requested_by = {}
+        # The modules of several nodes can be built concurrently with --jobs
+        self._lock = threading.Lock()
+
+    def _paths_to_root(self, index):
+        paths = self._paths.get(index)
+        if paths is None:
+            parents = self._parents[index]
+            if not parents:
+                paths = [()]
+            else:
+                paths = []
+                for position, parent_index in enumerate(parents):
+                    paths.extend((parent_index,) + path for path in self._paths_to_root(parent_index))
+                    if parent_index in self._truncated:
+                        self._truncated.add(index)
+                    if len(paths) >= self._max_paths:
+                        if len(paths) > self._max_paths or position < len(parents) - 1:
+                            self._truncated.add(index)
+                        break
+                paths = paths[:self._max_paths]
+            self._paths[index] = paths
+        return paths
+
+    def _report_truncated(self, index):
+        if index in self._reported or index not in self._truncated:
+            return
+        if not self._reported:
+            ConanOutput().warning(f"Some dependencies have more than {self._max_paths} paths to the root of the "
+                                  "graph, only the first ones are kept in their requestedBy. The limit can be "
+                                  "changed with the 'user.art:requested_by_max_paths' conf")
+        self._reported.add(index)
+        ConanOutput().verbose(f"requestedBy of {self._table[index].ref} truncated to {self._max_paths} paths")
+
+    def get(self, index, artifact_type):
+        key = (index, artifact_type)
+        with self._lock:
+            requested_by = self._requested_by.get(key)
+            if requested_by is None:
+                paths = self._paths_to_root(index)
+                self._report_truncated(index)
+                if artifact_type == "package":
+                    requested_by = [[self._table[i].package_ref for i in path] for path in paths if path]
+                else:
+                    requested_by = [[self._table[i].ref for i in path] for path in paths if path]
+                self._requested_by[key] = requested_by
+        return requested_by
 
 
 class _BuildInfo:
 
-    def __init__(self, conan_api, graph, name, number, repositories, build_url=None, with_dependencies=False,
-                 add_cached_deps=False, url=None, user=None, password=None):
+    def __init__(self, conan_api, graphs, name, number, repositories, build_url=None, with_dependencies=False,
+                 add_cached_deps=False, url=None, user=None, password=None, metadata_cache=None,
+                 executor=None, checksum_cache=None, checksums_from="local", previous=None,
+                 requested_by_max_paths=100):
         self._conan_api = conan_api
-        self._graph = graph
+        # Several graphs (like the ones of different configurations) are merged in the same Build Info
+        self._graphs = graphs
+        self._nodes = None
         self._name = name
         self._number = number
         self._repositories = repositories
@@ -128,6 +239,31 @@ class _BuildInfo:
         self._cached_artifact_origin = {}
         self._with_dependencies = with_dependencies
         self._add_cached_deps = add_cached_deps
+        self._metadata_cache = metadata_cache
+        self._executor = executor or RequestExecutor()
+        self._checksum_cache = checksum_cache
+        self._checksums_from = checksums_from
+        self._server_checksums = None
+        self._origin_repos = None
+        self._requested_by = None
+        self._requested_by_max_paths = requested_by_max_paths
+        self._dependency_artifacts = {}
+        self._hashes = {}
+        # Locks for the work done only once, even if several modules need it concurrently
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # Artifacts of the modules of a previous Build Info, by module id
+        self._previous_artifacts = None
+        self._previous_started = None
+        self._reused = set()
+        if previous is not None:
+            self._previous_artifacts = {module.get("id"): module.get("artifacts")
+                                        for module in previous.get("modules") or []}
+            try:
+                self._previous_started = datetime.datetime.strptime(previous.get("started"),
+                                                                    "%Y-%m-%dT%H:%M:%S.%f%z").timestamp()
+            except (TypeError, ValueError):
+                raise ConanException("The previous Build Info does not have a valid 'started' time")
 
     def _get_origin_repo(self, node):
         if not self._repositories:
@@ -144,17 +280,32 @@ class _BuildInfo:
                 "determine the origin of dependencies. Please provide '--url' or '--server'."
             )
 
-        ref_str = node.get("ref")
+        ref_str = node.ref
 
         if ref_str in self._cached_artifact_origin:
             return self._cached_artifact_origin[ref_str]
 
         # To link artifacts with repos search for the recipe's conanmanifest.txt in all repositories.
-        remote_path = _get_remote_path(ref_str)
+        remote_path = node.recipe_path
+        # Already searched in bulk for all the references, keep the priority of the repositories
+        origin_repos = self._origin_repos.get(remote_path) if self._origin_repos is not None else None
+        if origin_repos:
+            for repo in self._repositories:
+                if repo in origin_repos:
+                    self._cached_artifact_origin[ref_str] = repo
+                    return repo
+
+        # Not found in bulk, AQL does not search virtual repositories nor the not cached content of
+        # remote ones, so probe every repository
         for repo in self._repositories:
-            request_url = f"{self._url}/api/storage/{repo}/{remote_path}/conanmanifest.txt"
+            storage_path = f"{repo}/{remote_path}/conanmanifest.txt"
+            if self._get_cached_checksums(storage_path, node, "recipe"):
+                self._cached_artifact_origin[ref_str] = repo
+                return repo
+            request_url = f"{self._url}/api/storage/{storage_path}"
             try:
-                api_request("get", request_url, self._user, self._password)
+                response = api_request("get", request_url, self._user, self._password)
+                self._set_cached_checksums(storage_path, node, "recipe", json.loads(response).get("checksums"))
                 self._cached_artifact_origin[ref_str] = repo
                 return repo
             except NotFoundException:
@@ -166,12 +317,143 @@ class _BuildInfo:
             f"The package was not found in any of the specified repositories: {', '.join(self._repositories)}"
         )
 
+    def _aql_find(self, paths, name=None):
+        criteria = [{"$or": [{"repo": repo} for repo in self._repositories]},
+                    {"$or": [{"path": path} for path in paths]}]
+        if name is not None:
+            criteria.append({"name": name})
+        query = f'items.find({json.dumps({"$and": criteria})})' \
+                f'.include("repo","path","name","actual_md5","actual_sha1","sha256")' \
+                f'.sort({{"$asc":["repo","path","name"]}})'
+        return list(aql_search(self._url, query, self._user, self._password))
+
+    def _query_aql(self, paths, name=None):
+        """
+        Items of the given paths (and file name) in the repositories, with paginated AQL queries
+        of a bounded number of paths each, run with the executor
+        """
+        batches = [paths[i:i + _AQL_PATHS_PER_QUERY] for i in range(0, len(paths), _AQL_PATHS_PER_QUERY)]
+        results = self._executor.run(lambda batch: self._aql_find(batch, name), batches)
+        raise_first_error(results)
+        ConanOutput().verbose(f"{len(paths)} paths searched in Artifactory with {len(batches)} AQL queries")
+        return [item for items, _ in results for item in items]
+
+    def _get_related_nodes(self):
+        """ The nodes that will be modules of the Build Info and their dependencies, if added """
+        for node in self._nodes:
+            if not self._is_module(node):
+                continue
+            yield node
+            if self._with_dependencies:
+                yield from (self._nodes[require_index] for require_index in node.dependencies)
+
+    def _query_origin_repos(self):
+        """
+        Searches the recipe conanmanifest.txt of all the references of the graph in all the
+        repositories at once, instead of probing them one by one for every reference
+        """
+        recipe_nodes = {}
+        for node in self._get_related_nodes():
+            recipe_nodes.setdefault(node.recipe_path, node)
+        paths = list(recipe_nodes)
+        origin_repos = {path: set() for path in paths}
+        for item in self._query_aql(paths, "conanmanifest.txt"):
+            origin_repos.setdefault(item["path"], set()).add(item["repo"])
+            checksums = {"md5": item.get("actual_md5"), "sha1": item.get("actual_sha1"), "sha256": item.get("sha256")}
+            self._set_cached_checksums(f"{item['repo']}/{item['path']}/{item['name']}",
+                                       recipe_nodes[item["path"]], "recipe", checksums)
+        self._origin_repos = origin_repos
+
+    def _query_server_checksums(self):
+        """
+        Gets the checksums of all the recipe and package files of the graph from Artifactory, with
+        a few paginated AQL queries scoped to the repositories, instead of hashing the local files.
+        """
+        if not self._url:
+            raise ConanException("Artifactory url is required to get the checksums from the server. "
+                                 "Please provide '--url' or '--server'.")
+        paths = []
+        for node in self._get_related_nodes():
+            paths.append(node.recipe_path)
+            if node.package_path is not None:
+                paths.append(node.package_path)
+        paths = list(dict.fromkeys(paths))
+
+        # Only the paths found, the ones of virtual or remote repositories are collected like without it
+        server_checksums = {}
+        origin_repos = {path: set() for path in paths}
+        for item in self._query_aql(paths):
+            server_checksums.setdefault(f"{item['repo']}/{item['path']}", {})[item["name"]] = {
+                "md5": item.get("actual_md5"), "sha1": item.get("actual_sha1"), "sha256": item.get("sha256")}
+            if item["name"] == "conanmanifest.txt":
+                origin_repos.setdefault(item["path"], set()).add(item["repo"])
+        self._server_checksums = server_checksums
+        self._origin_repos = origin_repos
+
+    @staticmethod
+    def _is_revisioned(node, artifact_type):
+        # Only the paths with all the revisions are immutable and can be cached between runs
+        if not node.reference.revision:
+            return False
+        return artifact_type == "recipe" or node.package_path is not None
+
+    def _get_cached_checksums(self, storage_path, node, artifact_type):
+        if self._metadata_cache is None or not self._is_revisioned(node, artifact_type):
+            return None
+        return self._metadata_cache.get_checksums(self._url, storage_path)
+
+    def _set_cached_checksums(self, storage_path, node, artifact_type, checksums):
+        if self._metadata_cache is not None and checksums and self._is_revisioned(node, artifact_type):
+            self._metadata_cache.set_checksums(self._url, storage_path, checksums)
+
+    def _get_hashes(self, file_path):
+        # The files of a node are needed both for its modules and as dependencies of other modules
+        hashes = self._hashes.get(file_path)
+        if hashes is None:
+            if self._checksum_cache is None:
+                hashes = _get_hashes(file_path)
+            else:
+                hashes = self._checksum_cache.get_hashes(file_path, _get_hashes)
+            self._hashes[file_path] = hashes
+        return hashes
+
+    def _get_previous_artifacts(self, node, artifact_type, origin_repo, remote_path, artifacts_names):
+        """
+        The artifacts of the same recipe or package revision in the previous Build Info, if they are
+        still valid: in the same repository, with all the ``artifacts_names`` files in the Conan cache
+        among them, and those files not modified after the previous Build Info was created
+        """
+        if self._previous_artifacts is None or remote_path is None or not self._is_revisioned(node, artifact_type):
+            return None
+        module_id = node.ref if artifact_type == "recipe" else node.package_ref
+        artifacts = self._previous_artifacts.get(module_id)
+        if not artifacts or any(artifact.get("path") != f"{origin_repo}/{remote_path}/{artifact.get('name')}"
+                                for artifact in artifacts):
+            return None
+        folder = self.get_artifacts_folder(node, artifact_type)
+        if folder is not None:
+            folder = Path(folder)
+            previous_names = {artifact.get("name") for artifact in artifacts}
+            # Also the files that appeared later, like the .tgz of a later upload or sources download
+            for name in artifacts_names:
+                for file_path in (folder / name, folder.parent / "d" / name):
+                    try:
+                        mtime = file_path.stat().st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if name not in previous_names or mtime > self._previous_started:
+                        return None
+        self._reused.add((node.index, artifact_type))
+        return artifacts
+
     def get_artifacts_folder(self, node, artifact_type):
         if artifact_type == "package":
-            return node.get("package_folder")
+            return node.package_folder
         else:
-            reference = RecipeReference.loads(node.get("ref"))
-            return self._conan_api.cache.export_path(reference)
+            if node.export_folder is None:
+                with profiler.step("export folder"):
+                    node.export_folder = self._conan_api.cache.export_path(node.reference)
+            return node.export_folder
 
     def get_artifacts(self, node, artifact_type, is_dependency=False):
         """
@@ -181,34 +463,61 @@ class _BuildInfo:
         from a dependency they have an 'id' instead of 'name' and they don't have 'path'.
         """
 
-        origin_repo = self._get_origin_repo(node)
+        with profiler.step("origin lookup"):
+            origin_repo = self._get_origin_repo(node)
 
         assert artifact_type in ["recipe", "package"]
 
+        remote_path = node.recipe_path if artifact_type == "recipe" else node.package_path
+        # With --checksums-from=server, the checksums of the files in Artifactory, already queried in bulk,
+        # if AQL found the path
+        server_files = None
+        if self._server_checksums is not None and remote_path is not None:
+            server_files = self._server_checksums.get(f"{origin_repo}/{remote_path}")
+
         if artifact_type == "recipe":
             artifacts_names = ["conanfile.py", "conanmanifest.txt"]
-            reference = RecipeReference.loads(node.get("ref"))
-            export_path = self._conan_api.cache.export_path(reference)
-            if set(os.listdir(export_path)) != set(artifacts_names):  # Check if recipe has additional exports files
+            export_path = self.get_artifacts_folder(node, artifact_type)
+            with profiler.step("export folder"):
+                if server_files is not None and not os.path.isdir(export_path):
+                    has_exports = "conan_export.tgz" in server_files
+                else:
+                    has_exports = set(os.listdir(export_path)) != set(artifacts_names)
+            if has_exports:  # Check if recipe has additional exports files
                 artifacts_names.append("conan_export.tgz")
             artifacts_names.append("conan_sources.tgz")
         else:
             artifacts_names = ["conan_package.tgz", "conaninfo.txt", "conanmanifest.txt"]
 
-        def _get_local_artifacts():
+        def _artifact_info(file_name, md5, sha1, sha256):
+            artifact_info = {"type": os.path.splitext(file_name)[1].lstrip('.'),
+                             "sha256": sha256,
+                             "sha1": sha1,
+                             "md5": md5}
+            if not is_dependency:
+                artifact_info.update({"name": file_name, "path": f'{origin_repo}/{remote_path}/{file_name}'})
+            else:
+                ref = node.package_ref if artifact_type == "package" else node.ref
+                artifact_info.update({"id": f"{ref} :: {file_name}"})
+            return artifact_info
+
+        def _get_local_artifacts(artifacts_names):
             local_artifacts = []
             missing_artifacts = []
+            if not artifacts_names:
+                return (local_artifacts, missing_artifacts)
             artifacts_folder = self.get_artifacts_folder(node, artifact_type)
-            if artifacts_folder is None and artifact_type == "package" and node.get("binary") == "Skip":
-                ConanOutput().warning(f"Package is marked as 'Skip' for {node.get('ref')} and will not be included "
+            if artifacts_folder is None and artifact_type == "package" and node.binary == "Skip":
+                ConanOutput().warning(f"Package is marked as 'Skip' for {node.ref} and will not be included "
                                       "into the Build Info. If you want to get it included, use the conf argument: "
                                       "'-c:a tools.graph:skip_binaries=False' in your conan create/install command.")
                 return (local_artifacts, missing_artifacts)
 
             artifacts_folder = Path(artifacts_folder)
             dl_folder = artifacts_folder.parents[0] / "d"
-            dl_folder_files = [file for file in dl_folder.glob("*") if file.name in artifacts_names]
-            artifacts_folder_files = [file for file in artifacts_folder.glob("*") if file.name in artifacts_names]
+            with profiler.step("list files"):
+                dl_folder_files = [file for file in dl_folder.glob("*") if file.name in artifacts_names]
+                artifacts_folder_files = [file for file in artifacts_folder.glob("*") if file.name in artifacts_names]
             all_files = dl_folder_files + artifacts_folder_files
             
             processed_files = set()
@@ -217,153 +526,221 @@ class _BuildInfo:
                 file_name = file_path.name
                 if file_path.is_file() and file_name not in processed_files:
                     processed_files.add(file_path.name)
-                    md5, sha1, sha256 = _get_hashes(file_path)
-                    artifact_info = {"type": os.path.splitext(file_name)[1].lstrip('.'),
-                                     "sha256": sha256,
-                                     "sha1": sha1,
-                                     "md5": md5}
-
-                    if not is_dependency:
-                        remote_path = _get_remote_path(
-                            node.get('ref')) if artifact_type == "recipe" else _get_remote_path(node.get('ref'),
-                                                                                                node.get("package_id"),
-                                                                                                node.get("prev"))
-                        artifact_info.update({"name": file_name, "path": f'{origin_repo}/{remote_path}/{file_name}'})
-                    else:
-                        ref = node.get("ref")
-                        pkg = f":{node.get('package_id')}#{node.get('prev')}" if artifact_type == "package" else ""
-                        artifact_info.update({"id": f"{ref}{pkg} :: {file_name}"})
-
-                    local_artifacts.append(artifact_info)
+                    with profiler.step("hashing"):
+                        md5, sha1, sha256 = self._get_hashes(file_path)
+                    local_artifacts.append(_artifact_info(file_name, md5, sha1, sha256))
 
             missing_files = set(artifacts_names) - processed_files
             return (local_artifacts, missing_files)
 
         def _get_remote_artifacts(artifact):
-            artifact_info = None
             if not self._url:
                 raise ConanException(
                     "Missing Artifactory URL. The Conan local cache does not contain all the required information. "
                     "Please provide '--url' or '--server' arguments to retrieve the information from Artifactory."
                 )
 
-            remote_path = _get_remote_path(node.get('ref')) if artifact_type == "recipe" else _get_remote_path(
-                node.get('ref'), node.get("package_id"), node.get("prev"))
+            storage_path = f"{origin_repo}/{remote_path}/{artifact}"
+            request_url = f"{self._url}/api/storage/{storage_path}"
 
-            request_url = f"{self._url}/api/storage/{origin_repo}/{remote_path}/{artifact}"
+            with self._lock(("storage", request_url)):
+                return _get_storage_artifact(artifact, storage_path, request_url)
 
-            if not self._cached_artifact_info.get(request_url):
-                checksums = None
-                try:
-                    response = api_request("get", request_url, self._user, self._password)
-                    response_data = json.loads(response)
-                    checksums = response_data.get("checksums")
+        def _get_storage_artifact(artifact, storage_path, request_url):
+            artifact_info = None
+            if request_url not in self._cached_artifact_info:
+                checksums = self._get_cached_checksums(storage_path, node, artifact_type)
+                if checksums:
+                    self._cached_artifact_info[request_url] = checksums
+                else:
+                    try:
+                        response = api_request("get", request_url, self._user, self._password)
+                        response_data = json.loads(response)
+                        checksums = response_data.get("checksums")
+                        self._set_cached_checksums(storage_path, node, artifact_type, checksums)
+                    # pass if not found, maybe we do not have the sources in the repo
+                    except NotFoundException:
+                        pass
+                    # Also when not found, so it is not requested again for every module depending on it
                     self._cached_artifact_info[request_url] = checksums
-                # pass if not found, maybe we do not have the sources in the repo
-                except NotFoundException:
-                    pass
             else:
-                checksums = self._cached_artifact_info.get(request_url)
+                checksums = self._cached_artifact_info[request_url]
 
             if checksums:
-                artifact_info = {"type": os.path.splitext(artifact)[1].lstrip('.'),
-                                 "sha256": checksums.get("sha256"),
-                                 "sha1": checksums.get("sha1"),
-                                 "md5": checksums.get("md5")}
-
-                artifact_path = f'{origin_repo}/{remote_path}/{artifact}'
-                if not is_dependency:
-                    artifact_info.update({"name": artifact, "path": artifact_path})
-                else:
-                    ref = node.get("ref")
-                    pkg = f":{node.get('package_id')}#{node.get('prev')}" if artifact_type == "package" else ""
-                    artifact_info.update({"id": f"{ref}{pkg} :: {artifact}"})
+                artifact_info = _artifact_info(artifact, checksums.get("md5"), checksums.get("sha1"),
+                                               checksums.get("sha256"))
 
             return artifact_info
 
-        artifacts, missing = _get_local_artifacts()
+        previous_artifacts = self._get_previous_artifacts(node, artifact_type, origin_repo, remote_path,
+                                                         artifacts_names)
+        if previous_artifacts is not None:
+            # Unchanged since the previous Build Info, nothing to hash or request
+            artifacts = [_artifact_info(artifact["name"], artifact.get("md5"), artifact.get("sha1"),
+                                        artifact.get("sha256"))
+                         for artifact in previous_artifacts]
+            missing = set()
+        elif server_files is not None:
+            # Only the files missing in Artifactory are hashed locally
+            artifacts = [_artifact_info(name, server_files[name]["md5"], server_files[name]["sha1"],
+                                        server_files[name]["sha256"])
+                         for name in artifacts_names if name in server_files]
+            local_artifacts, missing = _get_local_artifacts([name for name in artifacts_names
+                                                             if name not in server_files])
+            artifacts.extend(local_artifacts)
+        else:
+            artifacts, missing = _get_local_artifacts(artifacts_names)
         if missing:
             tgz_items = {item for item in missing if item.endswith(".tgz") and "conan_sources.tgz" not in item}
             if tgz_items:
                 ConanOutput().warning(f"There are missing .tgz files ({','.join(tgz_items)}). Make sure to upload the "
                                       f"packages to Artifactory before creating a BuildInfo")
 
-        if 'conan_sources.tgz' in missing:
+        if 'conan_sources.tgz' in missing and server_files is None:
             # check if we have the conan_sources in Artifactory, if it's not there
             # maybe the package comes from an installation that did not build the package
             # so we don't fail if we can't find conan_sources.tgz
-            sources_artifact = _get_remote_artifacts("conan_sources.tgz")
+            with profiler.step("remote checksums"):
+                sources_artifact = _get_remote_artifacts("conan_sources.tgz")
             if sources_artifact:
                 artifacts.append(sources_artifact)
 
         folder = self.get_artifacts_folder(node, artifact_type)
         if not artifacts and folder:
-            raise ConanException(f"There are missing artifacts for the {node.get('ref')} {artifact_type}. "
+            raise ConanException(f"There are missing artifacts for the {node.ref} {artifact_type}. "
                                   "Check that you have all the packages installed in the Conan cache when creating the Build Info.")
 
         # complete the information for the artifacts:
 
         if is_dependency:
-            requested_by = _get_requested_by(self._graph["graph"]["nodes"], node.get("id"), artifact_type)
+            requested_by = self._requested_by.get(node.index, artifact_type)
             for artifact in artifacts:
                 artifact.update({"requestedBy": requested_by})
 
         return artifacts
 
-    def get_modules(self):
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _get_dependency_artifacts(self, node, artifact_type):
+        """
+        The dependency artifacts of a node are the same for all the modules depending on it, they are
+        computed once (even if several modules need them concurrently) and copied for every module
+        """
+        key = (node.index, artifact_type)
+        with self._lock(("dependency", key)):
+            artifacts = self._dependency_artifacts.get(key)
+            if artifacts is None:
+                artifacts = self.get_artifacts(node, artifact_type, is_dependency=True)
+                self._dependency_artifacts[key] = artifacts
+        return [dict(artifact) for artifact in artifacts]
+
+    def _is_module(self, node):
+        binary = node.binary
+        return node.ref and ((binary == "Build") or
+                             (binary in ["Cache", "Download", "Update"] and self._add_cached_deps))
+
+    def _get_node_modules(self, module_node):
+        """
+        The recipe module of a node and its package module, if it has a package revision, unless they
+        are already added by a previous graph
+        """
+        node, with_recipe, with_package = module_node
+        with profiler.node(node.package_ref if node.package_path is not None else node.ref):
+            return self._get_modules(node, with_recipe, with_package)
+
+    def _get_modules(self, node, with_recipe, with_package):
         ret = []
-        try:
-            nodes = self._graph["graph"]["nodes"]
-        except KeyError:
-            raise ConanException("JSON does not contain graph information")
-
-        for node in nodes.values():
-            ref = node.get("ref")
-            if ref:
-                transitive_dependencies = node.get("dependencies").keys() if node.get("dependencies").keys() else []
-                binary = node.get("binary")
-
-                if ref and ((binary == "Build") or (binary in ["Cache", "Download", "Update"] and self._add_cached_deps)):
-
-                    # recipe module
-                    module = {
-                        "type": "conan",
-                        "id": str(ref),
-                        "artifacts": self.get_artifacts(node, "recipe")
-                    }
-
-                    if self._with_dependencies:
-                        all_dependencies = []
-                        for require_id in transitive_dependencies:
-                            deps_artifacts = self.get_artifacts(nodes.get(require_id), "recipe",
-                                                                is_dependency=True)
-                            all_dependencies.extend(deps_artifacts)
-
-                        module.update({"dependencies": all_dependencies})
-
-                    ret.append(module)
-
-                    # package module
-                    if node.get("package_id") and node.get("prev"):
-                        module = {
-                            "type": "conan",
-                            "id": f'{str(ref)}:{node.get("package_id")}#{node.get("prev")}',
-                            "artifacts": self.get_artifacts(node, "package")
-                        }
-                        # get the dependencies and its artifacts
-                        if self._with_dependencies:
-                            all_dependencies = []
-                            for require_id in transitive_dependencies:
-                                deps_artifacts = self.get_artifacts(nodes.get(require_id), "package",
-                                                                    is_dependency=True)
-                                all_dependencies.extend(deps_artifacts)
-
-                            module.update({"dependencies": all_dependencies})
-
-                        ret.append(module)
 
+        # recipe module
+        if with_recipe:
+            module = {
+                "type": "conan",
+                "id": node.ref,
+                "artifacts": self.get_artifacts(node, "recipe")
+            }
+
+            if self._with_dependencies:
+                all_dependencies = []
+                for require_index in node.dependencies:
+                    deps_artifacts = self._get_dependency_artifacts(self._nodes[require_index], "recipe")
+                    all_dependencies.extend(deps_artifacts)
+
+                module.update({"dependencies": all_dependencies})
+
+            ret.append(module)
+
+        # package module
+        if with_package:
+            module = {
+                "type": "conan",
+                "id": node.package_ref,
+                "artifacts": self.get_artifacts(node, "package")
+            }
+            # get the dependencies and its artifacts
+            if self._with_dependencies:
+                all_dependencies = []
+                for require_index in node.dependencies:
+                    deps_artifacts = self._get_dependency_artifacts(self._nodes[require_index], "package")
+                    all_dependencies.extend(deps_artifacts)
+
+                module.update({"dependencies": all_dependencies})
+
+            ret.append(module)
         return ret
 
+    def _get_module_nodes(self):
+        self._nodes = []
+        graphs_nodes = []
+        for graph in self._graphs:
+            try:
+                nodes = graph["graph"]["nodes"]
+            except KeyError:
+                raise ConanException("JSON does not contain graph information")
+            start = len(self._nodes)
+            with profiler.phase("node table"):
+                _get_node_table(nodes, self._nodes)
+            graphs_nodes.append(self._nodes[start:])
+
+        if self._checksums_from == "server":
+            with profiler.phase("server checksums"):
+                self._query_server_checksums()
+        elif len(self._repositories) > 1 and self._url:
+            with profiler.phase("origin repositories"):
+                self._query_origin_repos()
+        if self._with_dependencies:
+            with profiler.phase("requested by index"):
+                self._requested_by = _RequestedBy(self._nodes, self._requested_by_max_paths)
+
+        # The modules already added by a previous graph (like the recipes shared by different
+        # configurations) are not added again, nor the artifacts of their files collected
+        module_nodes = []
+        module_ids = set()
+        for graph_nodes in graphs_nodes:
+            graph_module_ids = set()
+            for node in graph_nodes:
+                if not self._is_module(node):
+                    continue
+                with_recipe = node.ref not in module_ids
+                with_package = node.package_path is not None and node.package_ref not in module_ids
+                if with_recipe or with_package:
+                    graph_module_ids.update((node.ref, node.package_ref))
+                    module_nodes.append((node, with_recipe, with_package))
+            module_ids.update(graph_module_ids)
+        return module_nodes
+
+    def _iter_modules(self, module_nodes):
+        # The artifacts of every node are collected concurrently with --jobs (hashing local files and
+        # requesting the remote ones), but the modules keep the order of the graph nodes
+        for node_modules, error in self._executor.imap(self._get_node_modules, module_nodes):
+            if error is not None:
+                raise error
+            yield from node_modules
+        if self._previous_artifacts is not None:
+            ConanOutput().verbose(f"Artifacts of {len(self._reused)} recipes and packages reused from the "
+                                  f"previous Build Info")
+
     def header(self):
         header = {
             "version": "1.0.1",
@@ -382,10 +759,39 @@ class _BuildInfo:
 
         return header
 
-    def create(self):
-        bi = self.header()
-        bi.update({"modules": self.get_modules()})
-        return json.dumps(bi, indent=4)
+    def iter_json(self, compact=False):
+        """
+        Yields the Build Info JSON in chunks, one per module, as the modules are produced, so it can be
+        written without having all of it in memory. The result is the same as ``json.dumps()`` of
+        the whole Build Info with ``indent=4``, or with the most compact separators.
+        """
+        # The Build Info is started before the queries to Artifactory of the modules
+        header = self.header()
+        module_nodes = self._get_module_nodes()
+        # The artifacts of the modules are collected while the previous ones are serialized
+        modules = profiler.iter_phase("artifacts", self._iter_modules(module_nodes))
+        if compact:
+            yield json_codec.dumps(header, compact=True)[:-1] + ',"modules":['
+            for i, module in enumerate(modules):
+                with profiler.phase("serialization"):
+                    chunk = ("," if i else "") + json_codec.dumps(module, compact=True)
+                yield chunk
+            yield "]}"
+            return
+
+        # Header without its closing "\n}", modules indented inside it
+        yield json.dumps(header, indent=4)[:-2] + ',\n    "modules": ['
+        empty = True
+        for module in modules:
+            with profiler.phase("serialization"):
+                lines = json.dumps(module, indent=4).split("\n")
+                chunk = ("\n" if empty else ",\n") + "\n".join(f"        {line}" for line in lines)
+            yield chunk
+            empty = False
+        yield "]\n}" if empty else "\n    ]\n}"
+
+    def create(self, compact=False):
+        return "".join(self.iter_json(compact))
 
 
 def _check_min_required_conan_version(min_ver):
@@ -407,12 +813,23 @@ def _add_default_arguments(subparser, is_bi_create=False, is_bi_create_bundle=Fa
     subparser.add_argument("--user", help="User name for the Artifactory server.")
     subparser.add_argument("--password", help="Password for the Artifactory server.")
     subparser.add_argument("--token", help="Token for the Artifactory server.")
+    subparser.add_argument("--profile-report", default=None,
+                           help="Save a JSON report with the time, memory peak, requests to Artifactory and "
+                                "bytes hashed of every phase of the command (and of every graph node, for "
+                                "create) to this file.")
+    add_http_arguments(subparser)
     return subparser
 
 
 def text_formatter(info):
-    if info:
-        cli_out_write(info)
+    if isinstance(info, str) or not info:
+        if info:
+            cli_out_write(info)
+        return
+    # Streamed output, written while it is being generated
+    for chunk in info:
+        cli_out_write(chunk, endline="")
+    cli_out_write("")
 
 
 @conan_command(group="Artifactory")
@@ -442,24 +859,78 @@ def build_info_create(conan_api: ConanAPI, parser, subparser, *args):
     subparser.add_argument("--add-cached-deps", help="It will add not only the Conan packages that are built "
                            "but also the ones that are used from the cache but not built. Default: false.",
                            action='store_true', default=False)
+    subparser.add_argument("--checksums-from", choices=["local", "server"], default="local",
+                           help="Where to get the checksums of the artifacts from. 'local' hashes the files in the "
+                                "Conan cache, requesting to Artifactory only the ones that are missing. 'server' "
+                                "gets all of them from Artifactory with a few bulk queries, hashing locally only "
+                                "the files missing in the server. Default: local.")
+    subparser.add_argument("--jobs", type=int, default=None,
+                           help="Number of nodes of the graph whose artifacts are collected concurrently "
+                                "(hashing the local files and requesting the missing ones to Artifactory). "
+                                "Default: user.art:jobs conf or 1.")
+    subparser.add_argument("--stream", action="store_true", default=False,
+                           help="Write the modules of the Build Info as they are produced, instead of keeping "
+                                "all of them in memory to write them at the end. Useful for very big graphs.")
+    subparser.add_argument("--compact", action="store_true", default=False,
+                           help="Write the Build Info JSON without indentation nor whitespace.")
+    subparser.add_argument("--previous", default=None,
+                           help="Build Info JSON file of a previous build. The artifacts of the same recipe and "
+                                "package revisions are taken from it, instead of collecting them again, unless "
+                                "their files in the Conan cache were modified or added after it was created.")
+    subparser.add_argument("--json-file", action="append", default=[],
+                           help="Other Conan generated JSON output file, like the ones of other configurations of "
+                                "the same build, to merge in the same Build Info. The modules shared by several "
+                                "graphs are added once. You can add multiple files like --json-file=debug.json "
+                                "--json-file=release.json")
 
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
 
     url, user, password = get_url_user_password(args)
 
-    data = load_json(args.json)
+    graphs = []
+    for json_file in [args.json] + args.json_file:
+        with profiler.phase("load graph"):
+            data = _load_graph(json_file)
 
-    # remove the 'conanfile' node
-    if data["graph"]["nodes"]["0"]["recipe"] in ["Cli", "Consumer"]:
-        data["graph"]["nodes"].pop("0")
+        # remove the 'conanfile' node
+        if data["graph"]["nodes"]["0"]["recipe"] in ["Cli", "Consumer"]:
+            data["graph"]["nodes"].pop("0")
+        graphs.append(data)
 
+    metadata_cache = get_metadata_cache(conan_api) if url else None
+    checksum_cache = get_checksum_cache(conan_api)
 
-    bi = _BuildInfo(conan_api, data, args.build_name, args.build_number, repositories=args.repository,
+    bi = _BuildInfo(conan_api, graphs, args.build_name, args.build_number, repositories=args.repository,
                     build_url=args.build_url,
                     with_dependencies=args.with_dependencies,
-                    add_cached_deps=args.add_cached_deps, url=url, user=user, password=password)
+                    add_cached_deps=args.add_cached_deps, url=url, user=user, password=password,
+                    metadata_cache=metadata_cache, executor=get_executor(conan_api, args.jobs),
+                    checksum_cache=checksum_cache, checksums_from=args.checksums_from,
+                    previous=load_json(args.previous) if args.previous else None,
+                    requested_by_max_paths=conan_api.config.get("user.art:requested_by_max_paths", default=100,
+                                                                check_type=int))
+
+    def _close_caches():
+        if metadata_cache is not None:
+            metadata_cache.report("Artifactory metadata cache")
+            metadata_cache.close()
+        if checksum_cache is not None:
+            checksum_cache.report("Local checksums cache")
+            checksum_cache.close()
+
+    if args.stream:
+        def _stream():
+            try:
+                yield from bi.iter_json(compact=args.compact)
+            finally:
+                _close_caches()
+        return _stream()
 
-    return bi.create()
+    try:
+        return bi.create(compact=args.compact)
+    finally:
+        _close_caches()
 
 
 @conan_subcommand(formatters={"text": text_formatter})
@@ -470,13 +941,20 @@ def build_info_upload(conan_api: ConanAPI, parser, subparser, *args):
     _add_default_arguments(subparser)
 
     subparser.add_argument("build_info", help="BuildInfo json file.")
+    subparser.add_argument("--jobs", type=int, default=None,
+                           help="Number of concurrent requests to Artifactory. Default: user.art:jobs conf or 1.")
+    subparser.add_argument("--compress", action="store_true", default=None,
+                           help="Upload the Build Info gzip compressed. Default: user.art:compress_requests "
+                                "conf or false.")
 
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
     assert_server_or_url_user_password(args)
 
     url, user, password = get_url_user_password(args)
 
-    build_info_json = load_json(args.build_info)
+    with profiler.phase("load build info"):
+        build_info_json = load_json(args.build_info)
 
     # first, set the properties build.name and build.number
     # for the artifacts in the BuildInfo
@@ -484,21 +962,48 @@ def build_info_upload(conan_api: ConanAPI, parser, subparser, *args):
     build_name = build_info_json.get("name")
     build_number = build_info_json.get("number")
 
-    for module in build_info_json.get('modules'):
-        for artifact in module.get('artifacts'):
-            artifact_path = artifact.get('path')
-            artifact_properties = get_properties(artifact_path, url, user, password)
-
-            artifact_properties.setdefault("build.name", []).append(build_name)
-            artifact_properties.setdefault("build.number", []).append(build_number)        
-
-            set_properties(artifact_properties, artifact_path, url, user, password, False)
+    # The current properties of all the artifacts are queried in bulk, and only the artifacts
+    # without the build properties yet are patched
+    executor = get_executor(conan_api, args.jobs)
+    artifact_paths = list(dict.fromkeys(artifact.get('path') for module in build_info_json.get('modules')
+                                        for artifact in module.get('artifacts')))
+    with profiler.phase("query properties"):
+        properties, queries = get_properties_bulk(artifact_paths, url, user, password, executor)
+        # The artifacts not found by AQL are requested one by one, not to replace their properties
+        not_found = [artifact_path for artifact_path in artifact_paths if artifact_path not in properties]
+        results = executor.run(lambda artifact_path: get_properties(artifact_path, url, user, password), not_found)
+        raise_first_error(results)
+        for artifact_path, (artifact_properties, _) in zip(not_found, results):
+            properties[artifact_path] = artifact_properties or {}
+        queries += len(not_found)
+    patches = []
+    for artifact_path in artifact_paths:
+        artifact_properties = properties[artifact_path]
+        build_properties = {}
+        for key, value in (("build.name", build_name), ("build.number", build_number)):
+            values = artifact_properties.get(key, [])
+            if value not in values:
+                build_properties[key] = values + [value]
+        if build_properties:
+            patches.append((artifact_path, build_properties))
+
+    with profiler.phase("set properties"):
+        results = executor.run(lambda patch: set_properties(patch[1], patch[0], url, user, password, False),
+                               patches)
+    raise_first_error(results)
+    # Compared with requesting the properties of every artifact and patching it, one by one
+    ConanOutput().verbose(f"Build properties set to {len(patches)} of {len(artifact_paths)} artifacts with "
+                          f"{queries + len(patches)} requests to Artifactory "
+                          f"({2 * len(artifact_paths) - queries - len(patches)} requests saved)")
 
     # now upload the BuildInfo
     request_url = f"{url}/api/build"
     if args.project is not None:
         request_url = f"{request_url}?project={args.project}"
-    response = api_request("put", request_url, user, password, json_data=json.dumps(build_info_json))
+    compress = args.compress or conan_api.config.get("user.art:compress_requests", default=False, check_type=bool)
+    with profiler.phase("upload build info"):
+        response = api_request("put", request_url, user, password,
+                               json_data=json_codec.dumps(build_info_json, compact=True), compress=compress)
     if response:
         return response
     else:
@@ -523,6 +1028,7 @@ def build_info_promote(conan_api: ConanAPI, parser, subparser, *args):
     subparser.add_argument("--comment", help="An optional comment describing the reason for promotion. Default: ''")
 
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
     if args.comment and not args.status:
         ConanOutput().warning("A comment was provided without a --status. The comment will not be tracked.")
 
@@ -562,6 +1068,7 @@ def build_info_get(conan_api: ConanAPI, parser, subparser, *args):
     subparser.add_argument("build_number", help="BuildInfo number to get.")
 
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
 
     assert_server_or_url_user_password(args)
     url, user, password = get_url_user_password(args)
@@ -591,6 +1098,7 @@ def build_info_delete(conan_api: ConanAPI, parser, subparser, *args):
                            action='store_true', default=False, )
 
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
     assert_server_or_url_user_password(args)
 
     url, user, password = get_url_user_password(args)
@@ -628,8 +1136,12 @@ def build_info_append(conan_api: ConanAPI, parser, subparser, *args):
     subparser.add_argument("--build-info-file", help="Path to the build-info file in your local folder. "
                                                 "You can add multiple build-info files like --build-info=bi-1.json"
                                                 " --build-info=bi-2.json", action="append")
+    subparser.add_argument("--jobs", type=int, default=None,
+                           help="Number of Build Infos downloaded concurrently from Artifactory. "
+                                "Default: user.art:jobs conf or 1.")
 
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
 
     if not args.build_info and not args.build_info_file:
         raise ConanException("At least one of the arguments --build-info or --build-info-file is required. "
@@ -637,36 +1149,50 @@ def build_info_append(conan_api: ConanAPI, parser, subparser, *args):
                              "--build-info=build_name,build_number or a local build info file with "
                              "--build-info-file=path_to_bi.json")
 
-    all_modules = []
+    # Modules by id, in the order they are appended
+    all_modules = {}
 
     def _add_modules_from_buildinfo(build_info_data):
         for module in build_info_data.get("modules"):
             # avoid repeating shared recipe modules between builds
-            if not any(d['id'] == module.get('id') for d in all_modules):
-                all_modules.append(module)
+            all_modules.setdefault(module.get('id'), module)
 
     if args.build_info:
         assert_server_or_url_user_password(args)
         url, user, password = get_url_user_password(args)
 
+        builds = []
         for build_info in args.build_info:
             if not "," in build_info:
                 raise ConanException("Please, provide the build name and number to append in the format: "
                                      "--build-info=build_name,build_number")
-            name, number = build_info.split(",")
+            builds.append(build_info.split(","))
+
+        def _get_buildinfo(build):
+            name, number = build
             bi_json = get_buildinfo(name, number, url, user, password, args.project)
-            bi_data = json.loads(bi_json).get("buildInfo")
-            _add_modules_from_buildinfo(bi_data)
+            return json_codec.loads(bi_json).get("buildInfo")
+
+        # Downloaded concurrently, but appended in the order of the arguments
+        results = get_executor(conan_api, args.jobs).imap(_get_buildinfo, builds)
+        for bi_data, error in profiler.iter_phase("download build infos", results):
+            if error is not None:
+                raise error
+            with profiler.phase("merge"):
+                _add_modules_from_buildinfo(bi_data)
 
     if args.build_info_file:
         for build_info_file in args.build_info_file:
-            bi_data = load_json(build_info_file)
-            _add_modules_from_buildinfo(bi_data)
+            with profiler.phase("load build info files"):
+                bi_data = load_json(build_info_file)
+            with profiler.phase("merge"):
+                _add_modules_from_buildinfo(bi_data)
 
     bi = _BuildInfo(conan_api, None, args.build_name, args.build_number, None)
     bi_json = bi.header()
-    bi_json.update({"modules": all_modules})
-    return json.dumps(bi_json, indent=4)
+    bi_json.update({"modules": list(all_modules.values())})
+    with profiler.phase("serialization"):
+        return json.dumps(bi_json, indent=4)
 
 
 @conan_subcommand(formatters={"text": text_formatter})
@@ -690,6 +1216,7 @@ def build_info_bundle_create(conan_api: ConanAPI, parser, subparser, *args):
 
 
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
 
     if not args.build_info:
         raise ConanException("--build-info is required. Please provide at least one build info in the format 'build_name,build_number'.")
@@ -755,6 +1282,7 @@ def build_info_bundle_delete(conan_api: ConanAPI, parser, subparser, *args):
                            help="Determines whether the deletion is asynchronous (true) or synchronous (false). Default is true.")
 
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
     assert_server_or_url_user_password(args)
 
     url, user, password = get_url_user_password(args)
@@ -10,7 +10,8 @@ from conan.api.model import RecipeReference, PkgReference
 from conan.api.model import MultiPackagesList
 from conan.errors import ConanException
 
-from utils import api_request, assert_server_or_url_user_password, BadRequestException
+from utils import add_http_arguments, api_request, assert_server_or_url_user_password, \
+    configure_http, get_executor, BadRequestException
 from cmd_server import get_url_user_password
 
 
@@ -47,36 +48,50 @@ def _request(url, user, password, request_type, request_url):
 
 
 def _promote_path(url, user, password, origin, destination, path, continue_on_400=False):
-    ConanOutput().subtitle(f"Promoting {path}")
+    """
+    Copies the path from the origin to the destination repository. Returns "exists" if the destination
+    already has it, "promoted" if it was copied or "missing" if it is not in the origin and
+    ``continue_on_400`` is set. Nothing is printed here, so it can run concurrently.
+    """
     path = urllib.parse.quote_plus(path, safe='/')
     # The copy api creates a subfolder if the destination already exists, need to check beforehand to avoid this
     try:
         # This first request will raise a 404 if no file is found
         _request(url, user, password, "get", f"api/storage/{destination}/{path}")
-        ConanOutput().warning("Destination already exists, skipping")
+        return "exists"
     except ConanException:
         try:
             _request(url, user, password, "post", f"api/copy/{origin}/{path}?to=/{destination}/{path}&suppressLayouts=0")
-            ConanOutput().success("Promoted file")
+            return "promoted"
         except BadRequestException:
             if continue_on_400:
-                ConanOutput().error(f"Failed to promote {path}: Not found in origin, continuing...")
-            else:
-                raise
-        except ConanException as e:
-            ConanOutput().error(f"Failed to promote {path}: {e}")
+                return "missing"
             raise
 
 
-def _promote_package_prev(url, user, password, origin, destination, pref_with_prev):
+def _report_promotion(path, status, error):
+    ConanOutput().subtitle(f"Promoting {path}")
+    quoted_path = urllib.parse.quote_plus(path, safe='/')
+    if isinstance(error, BadRequestException):
+        raise error
+    elif error is not None:
+        ConanOutput().error(f"Failed to promote {quoted_path}: {error}")
+        raise error
+    elif status == "exists":
+        ConanOutput().warning("Destination already exists, skipping")
+    elif status == "promoted":
+        ConanOutput().success("Promoted file")
+    else:
+        ConanOutput().error(f"Failed to promote {quoted_path}: Not found in origin, continuing...")
+
+
+def _get_package_prev_paths(pref_with_prev):
     revision_path = _get_path_from_pref(pref_with_prev)
     # Manually promote the files, Artifactory will take care of the timestamp
-    for file, continue_on_error in (("conan_package.tgz", True),
-                                    ("conaninfo.txt", False),
-                                    ("conanmanifest.txt", False)):
-        _promote_path(url, user, password, origin, destination,
-                      f"{revision_path}/{file}",
-                      continue_on_400=continue_on_error)
+    return [(f"{revision_path}/{file}", continue_on_error)
+            for file, continue_on_error in (("conan_package.tgz", True),
+                                            ("conaninfo.txt", False),
+                                            ("conanmanifest.txt", False))]
 
 
 @conan_command(group="Artifactory")
@@ -96,8 +111,12 @@ def promote(conan_api: ConanAPI, parser, *args):
     parser.add_argument("--user", help="User name for the repository")
     parser.add_argument("--password", help="Password for the user name (instead of token)")
     parser.add_argument("--token", help="Token for the repository (instead of password)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Number of concurrent requests to Artifactory. Default: user.art:jobs conf or 1.")
+    add_http_arguments(parser)
 
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
 
     url, user, password = get_url_user_password(args)
     if not url.endswith("/"):
@@ -131,21 +150,36 @@ def promote(conan_api: ConanAPI, parser, *args):
 
     pkglist = multi_package_list[origin_remote]
 
+    # Promotions and the messages about recipes without packages, in the order they are reported
+    tasks = []
     for name_version, recipe in pkglist.serialize().items():
         if "revisions" not in recipe:
             raise ConanException(f"Recipe {name_version} does not have any revisions specified. "
                                  "It's necessary to specify recipe revisions for promotion.")
         for rrev, recipe_revision in recipe["revisions"].items():
-            _promote_path(url, user, password, args.origin, args.destination,
-                          _get_export_path_from_rrev(f"{name_version}#{rrev}"))
+            tasks.append((_get_export_path_from_rrev(f"{name_version}#{rrev}"), False, None))
             if "packages" not in recipe_revision:
-                ConanOutput().info(f"Recipe {name_version}#{rrev} does not have any package, skipping")
+                tasks.append((None, False, f"Recipe {name_version}#{rrev} does not have any package, skipping"))
                 continue
             for pkgid, package in recipe_revision["packages"].items():
                 if "revisions" not in package:
                     raise ConanException(f"Package {name_version}#{rrev}:{pkgid} does not have any revisions specified. "
                                          "It's necessary to specify package revisions for promotion.")
                 for prev, package_revision in package["revisions"].items():
-                    _promote_package_prev(url, user, password,
-                                          args.origin, args.destination,
-                                          f"{name_version}#{rrev}:{pkgid}#{prev}")
+                    tasks.extend((path, continue_on_400, None) for path, continue_on_400
+                                 in _get_package_prev_paths(f"{name_version}#{rrev}:{pkgid}#{prev}"))
+
+    def _promote(task):
+        path, continue_on_400, _ = task
+        if path is None:
+            return None
+        return _promote_path(url, user, password, args.origin, args.destination, path,
+                             continue_on_400=continue_on_400)
+
+    # Each result is reported as soon as it and the ones before it are done
+    results = get_executor(conan_api, args.jobs).imap(_promote, tasks)
+    for (path, _, message), (status, error) in zip(tasks, results):
+        if message is not None:
+            ConanOutput().info(message)
+        else:
+            _report_promotion(path, status, error)
@@ -9,10 +9,15 @@ except:
     from conans.model.package_ref import PkgReference
 from conan.errors import ConanException
 
-from utils import api_request, assert_server_or_url_user_password
+from utils import RequestExecutor, add_http_arguments, api_request, api_request_items, \
+    assert_server_or_url_user_password, configure_http, get_executor, json_codec, raise_first_error
 from cmd_server import get_url_user_password
 
 
+# Artifacts in every AQL query of get_properties_bulk
+_AQL_ITEMS_PER_QUERY = 100
+
+
 def set_properties(properties, path, url, user, password, recursive):
     json_data = json.dumps({"props": properties})
     recursive = "1" if recursive else "0"
@@ -32,6 +37,42 @@ def get_properties(path, url, user, password):
     return properties
 
 
+def _find_properties(items, url, user, password):
+    # Artifactory does not support sort, offset nor limit when including properties, so the query is not
+    # paginated, its size is bounded by the number of items instead
+    criteria = {"$or": [{"repo": repo, "path": path, "name": name} for repo, path, name in items]}
+    query = f'items.find({json.dumps(criteria)}).include("repo","path","name","property")'
+    response = api_request("post", f"{url}/api/search/aql", user, password, json_data=query,
+                           content_type="text/plain")
+    return json_codec.loads(response).get("results", [])
+
+
+def get_properties_bulk(paths, url, user, password, executor=None):
+    """
+    Properties of many artifacts, like ``get_properties()`` for every path (an empty dict for the ones
+    without properties), with AQL queries of a bounded number of artifacts each. Returns them and the number of queries.
+    The paths not found by AQL, like the ones of virtual or remote repositories, are not in the result.
+    """
+    items = []
+    for artifact_path in paths:
+        repo, _, item_path = artifact_path.partition("/")
+        folder, _, name = item_path.rpartition("/")
+        items.append((repo, folder or ".", name))
+    batches = [items[i:i + _AQL_ITEMS_PER_QUERY] for i in range(0, len(items), _AQL_ITEMS_PER_QUERY)]
+    results = (executor or RequestExecutor()).run(lambda batch: _find_properties(batch, url, user, password),
+                                                  batches)
+    raise_first_error(results)
+
+    properties = {}
+    for found, _ in results:
+        for item in found:
+            folder = "" if item["path"] == "." else f"{item['path']}/"
+            item_properties = properties.setdefault(f"{item['repo']}/{folder}{item['name']}", {})
+            for prop in item.get("properties", []):
+                item_properties.setdefault(prop["key"], []).append(prop.get("value", ""))
+    return properties, len(batches)
+
+
 def _get_path_from_ref(ref):
     try:
         package_ref = PkgReference.loads(ref)
@@ -58,6 +99,7 @@ def _add_default_arguments(subparser):
     subparser.add_argument("--token", help="Token for the Artifactory server")
     subparser.add_argument("--property", action='append',
                            help='Property to add, like --property="build.name=buildname" --property="build.number=1"')
+    add_http_arguments(subparser)
 
     return subparser
 
@@ -76,8 +118,11 @@ def property_add(conan_api: ConanAPI, parser, subparser, *args):
     """
 
     _add_default_arguments(subparser)
+    subparser.add_argument("--jobs", type=int, default=None,
+                           help="Number of concurrent requests to Artifactory. Default: user.art:jobs conf or 1.")
 
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
 
     assert_server_or_url_user_password(args)
 
@@ -96,14 +141,14 @@ def property_add(conan_api: ConanAPI, parser, subparser, *args):
 
     request_url = f"{url}/api/storage/{args.repository}/{root_path}?list&deep=1&listFolders={list_folders}"
 
-    data = json.loads(api_request("get", request_url, user, password))
-
+    # the listing can be huge for references with many binaries, process the files while they arrive
+    files = api_request_items(request_url, "files", user, password)
 
     # just consider those artifacts that have conan in the name
-    # conan_artifacts = [artifact for artifact in data.get("files") if "conan" in artifact.get('uri')]
+    # conan_artifacts = [artifact for artifact in files if "conan" in artifact.get('uri')]
 
     # get properties for all artifacts
-    for artifact in data.get("files"):
+    def _add_properties(artifact):
         uri = artifact.get('uri')
         path = f"{args.repository}/{root_path}{uri}"
 
@@ -116,6 +161,9 @@ def property_add(conan_api: ConanAPI, parser, subparser, *args):
         if artifact_properties:
             set_properties(artifact_properties, path, url, user, password, False)
 
+    results = get_executor(conan_api, args.jobs).run(_add_properties, files)
+    raise_first_error(results)
+
 
 @conan_subcommand()
 def property_set(conan_api: ConanAPI, parser, subparser, *args):
@@ -128,6 +176,7 @@ def property_set(conan_api: ConanAPI, parser, subparser, *args):
     subparser.add_argument('--no-recursive', dest='recursive',
                            action='store_false', help='Will not recursively set properties.')
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
     assert_server_or_url_user_password(args)
 
     if not args.property:
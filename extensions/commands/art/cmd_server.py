@@ -8,7 +8,8 @@ from conan.api.output import ConanOutput, cli_out_write
 from conan.cli.command import conan_command, conan_subcommand
 from conan.errors import ConanException
 
-from utils import api_request
+from utils import AccessToken, add_http_arguments, api_request, configure_http, create_access_token
+from caches import get_metadata_cache
 
 SERVERS_FILENAME = ".art-servers"
 
@@ -20,6 +21,9 @@ def get_url_user_password(args):
         url = server.get("url")
         user = server.get("user")
         password = server.get("password")
+        if server.get("access_token"):
+            password = AccessToken(url, server["access_token"],
+                                   on_refresh=lambda token_data: _update_access_token(server_name, token_data))
     else:
         url = args.url
         user = args.user
@@ -57,6 +61,14 @@ def _write_servers(servers):
         servers_file.write(base64.b64encode(data.encode('utf-8')).decode('utf-8'))
 
 
+def _update_access_token(server_name, token_data):
+    servers = _read_servers()
+    for s in servers:
+        if s["name"] == server_name:
+            s["access_token"] = token_data
+    _write_servers(servers)
+
+
 def _assert_new_server(server_name, servers):
     for s in servers:
         if server_name == s["name"]:
@@ -92,8 +104,18 @@ def server_add(conan_api: ConanAPI, parser, subparser, *args):
     subparser.add_argument("--user", help="User name for the Artifactory server.")
     subparser.add_argument("--password", help="Password for the Artifactory server.")
     subparser.add_argument("--token", help="Token for the artifactory server")
+    subparser.add_argument("--access-token", action="store_true", default=False,
+                           help="Obtain a refreshable scoped access token with the credentials and store it "
+                                "instead of the password. Requests are authenticated with it as a Bearer "
+                                "token and it is refreshed automatically before it expires.")
+    subparser.add_argument("--token-scope", default="applied-permissions/user",
+                           help="Scope of the access token. Default: applied-permissions/user")
+    subparser.add_argument("--token-expires-in", type=int, default=3600,
+                           help="Seconds until the access token expires and has to be refreshed. Default: 3600")
+    add_http_arguments(subparser)
 
     args = parser.parse_args(*args)
+    configure_http(conan_api, args)
 
     if args.password and args.token:
         raise ConanException("--password and --token arguments cannot be used at the same time. Please specify either --password OR --token.")
@@ -118,17 +140,27 @@ def server_add(conan_api: ConanAPI, parser, subparser, *args):
     servers = _read_servers()
     _assert_new_server(name, servers)
 
-    if not token:
-        # TODO: manage error with auth
-        token = api_request("get", f"{url}/api/security/encryptedPassword", user, password)
+    if args.access_token:
+        access_token = create_access_token(url, user, token or password, scope=args.token_scope,
+                                           expires_in=args.token_expires_in)
+        # Check token is valid
+        api_request("get", f"{url}/api/system/ping", user, AccessToken(url, access_token))
+        new_server = {"name": name,
+                      "url": url,
+                      "user": user,
+                      "access_token": access_token}
+    else:
+        if not token:
+            # TODO: manage error with auth
+            token = api_request("get", f"{url}/api/security/encryptedPassword", user, password)
 
-    # Check token is valid
-    api_request("get", f"{url}/api/system/ping", user, token)
+        # Check token is valid
+        api_request("get", f"{url}/api/system/ping", user, token)
 
-    new_server = {"name": name,
-                  "url": url,
-                  "user": user,
-                  "password": token}
+        new_server = {"name": name,
+                      "url": url,
+                      "user": user,
+                      "password": token}
     servers.append(new_server)
     _write_servers(servers)
     ConanOutput().success(f"Server '{name}' ({url}) added successfully")
@@ -153,22 +185,50 @@ def server_remove(conan_api: ConanAPI, parser, subparser, *args):
         else:
             url = s["url"]
     _write_servers(keep_servers)
+    _invalidate_metadata_cache(conan_api, url)
     ConanOutput().success(f"Server '{name}' ({url}) removed successfully")
 
 
+def _invalidate_metadata_cache(conan_api, url=None):
+    metadata_cache = get_metadata_cache(conan_api)
+    if metadata_cache is not None:
+        metadata_cache.invalidate(url)
+        metadata_cache.close()
+
+
+@conan_subcommand()
+def server_clean_cache(conan_api: ConanAPI, parser, subparser, *args):
+    """
+    Removes the Artifactory metadata cached in the Conan home for a server, or for all of them.
+    """
+    subparser.add_argument("name", nargs="?", help="Name of the server. Default: all the servers")
+    args = parser.parse_args(*args)
+
+    if args.name:
+        server = _get_server(args.name.strip())
+        _invalidate_metadata_cache(conan_api, server["url"])
+        ConanOutput().success(f"Cached metadata of server '{server['name']}' ({server['url']}) removed")
+    else:
+        _invalidate_metadata_cache(conan_api)
+        ConanOutput().success("Cached metadata of all servers removed")
+
+
 def _output_server_list_text(servers):
     if servers:
         for s in servers:
             cli_out_write(f"{s['name']}:")
             cli_out_write(f"url: {s['url']}", indentation=2)
             cli_out_write(f"user: {s['user']}", indentation=2)
-            cli_out_write(f"password: *******", indentation=2)
+            if s.get("access_token"):
+                cli_out_write(f"access token: *******", indentation=2)
+            else:
+                cli_out_write(f"password: *******", indentation=2)
     else:
         cli_out_write("No servers configured. Use `conan art:server add` command to add one.")
 
 
 def _output_server_list_json(servers):
-    [s.pop("password") for s in servers]
+    [(s.pop("password", None), s.pop("access_token", None)) for s in servers]
     cli_out_write(json.dumps({"servers": servers}, indent=4))
 
 
@@ -1,21 +1,117 @@
+import atexit
+import codecs
+import email.utils
+import gzip
+import importlib
 import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
 import requests
+import requests.auth
+from requests.adapters import HTTPAdapter
 
+from conan.api.output import ConanOutput
 from conan.errors import ConanException
 
 
+# Values of a compact JSON object or array that could be floats (orjson writes NaN and infinity as
+# null). It can also match inside strings, then the standard library is used although not necessary
+_JSON_FLOAT = re.compile(r"[:,\[](?=[-\dnNI])(?:-?\d+[.eE]|null|NaN|-?Inf)")
+# Non-ASCII and DEL characters, that the standard library escapes (str.isascii() needs Python 3.7)
+_JSON_NON_ASCII = re.compile(r"[^\x00-\x7e]")
+
+
+class _JsonCodec:
+    """
+    Parses and serializes JSON with a faster backend (orjson or ujson) if it is installed, or
+    with the standard library. The serialized JSON is always the same as the one of ``json.dumps``:
+    the backends are only used for the compact serialization (they do not support the indentation
+    of the standard library), and their result is only used when it has no escaped or non-ASCII
+    characters nor floats, that they could encode differently.
+    """
+    BACKENDS = ("orjson", "ujson", "json")
+
+    def __init__(self):
+        self.backend = None
+        self._module = None
+        self.configure()
+
+    def configure(self, backend=None):
+        """ ``backend`` is one of ``BACKENDS``, by default the first one that is installed """
+        if backend is not None and backend not in self.BACKENDS:
+            raise ConanException(f"Unknown JSON backend '{backend}', valid values: {', '.join(self.BACKENDS)}")
+        for name in [backend] if backend else self.BACKENDS:
+            try:
+                self._module = importlib.import_module(name)
+            except ImportError:
+                if backend:
+                    raise ConanException(f"The JSON backend '{backend}' is not installed")
+                continue
+            self.backend = name
+            return
+
+    def loads(self, data):
+        return self._module.loads(data)
+
+    def _fast_dumps(self, obj):
+        try:
+            if self.backend == "orjson":
+                return self._module.dumps(obj).decode("utf-8")
+            return self._module.dumps(obj, ensure_ascii=True, escape_forward_slashes=False)
+        except (TypeError, ValueError, OverflowError):  # like non-str keys, big integers
+            return None
+
+    def dumps(self, obj, indent=None, compact=False):
+        if compact and self.backend != "json":
+            data = self._fast_dumps(obj)
+            # Printable ASCII (the standard library escapes the rest) and no floats
+            if data is not None and data[:1] in ("{", "[") and "\\" not in data \
+                    and not _JSON_NON_ASCII.search(data) and not _JSON_FLOAT.search(data):
+                return data
+        if compact:
+            return json.dumps(obj, separators=(",", ":"))
+        return json.dumps(obj, indent=indent)
+
+
+json_codec = _JsonCodec()
+
+
 def load_json(json_file):
     try:
-        with open(json_file, 'r') as f:
-            data = json.load(f)
+        with open(json_file, 'rb') as f:
+            data = json_codec.loads(f.read())
         return data
     except FileNotFoundError:
         raise ConanException(f"Error: The file {json_file} was not found.")
-    except json.JSONDecodeError:
+    except ValueError:  # the JSONDecodeError of every backend
+        raise ConanException(f"Error: The file {json_file} is not a valid JSON file.")
+    except Exception as e:
+        raise ConanException(f"An unexpected error occurred: {e}")
+
+def iter_json_file(json_file, *keys):
+    """
+    Streaming version of ``load_json`` that yields the entries of the array or object at the
+    ``keys`` path of the file (see ``_JsonStream``), without loading the whole file in memory.
+    """
+    try:
+        with open(json_file, 'rb') as f:
+            yield from _JsonStream(iter(lambda: f.read(1 << 16), b""), *keys)
+    except FileNotFoundError:
+        raise ConanException(f"Error: The file {json_file} was not found.")
+    except ValueError:  # the JSONDecodeError, also of truncated files, and the UnicodeDecodeError
         raise ConanException(f"Error: The file {json_file} is not a valid JSON file.")
     except Exception as e:
         raise ConanException(f"An unexpected error occurred: {e}")
 
+
 def response_to_str(response):
     content = response.content
     try:
@@ -61,21 +157,622 @@ class UnexpectedResponseException(ConanException):
     pass
 
 
-def api_request(method, request_url, user=None, password=None, json_data=None,
-                sign_key_name=None):
-    headers = {}
-    if json_data:
-        headers.update({"Content-Type": "application/json"})
-    if sign_key_name:
-        headers.update({"X-JFrog-Crypto-Key-Name": sign_key_name})
+_THROTTLING_STATUS_CODES = (429, 503)
+_MAX_RETRY_AFTER = 120
+
+
+def _get_retry_after(response):
+    """
+    Seconds to wait according to the Retry-After header, that can be a number of seconds or
+    an HTTP date. Returns None if there is no (valid) header.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        seconds = float(retry_after)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), _MAX_RETRY_AFTER)
+
+
+class _AdaptiveLimit:
+    """
+    AIMD concurrency limit for the requests to one server. It starts with one request in flight
+    and grows by one for every healthy response until the first congestion signal (slow start).
+    Then it grows by one for every ``limit`` healthy responses and it is halved every time the
+    server throttles (429/503) or answers slower than ``slow_response`` seconds. A Retry-After
+    from the server pauses all the new requests to that server.
+    """
+
+    def __init__(self, max_limit, slow_response):
+        self._condition = threading.Condition()
+        self._max_limit = max_limit
+        self._slow_response = slow_response
+        self._limit = 1.0
+        self._slow_start = True
+        self._in_flight = 0
+        self._paused_until = 0.0
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                elif self._in_flight >= int(self._limit):
+                    self._condition.wait()
+                else:
+                    break
+            self._in_flight += 1
+
+    def release(self, elapsed, throttled=False, retry_after=None):
+        with self._condition:
+            self._in_flight -= 1
+            if throttled or elapsed > self._slow_response:
+                self._slow_start = False
+                self._limit = max(1.0, self._limit / 2)
+            elif self._slow_start:
+                self._limit = min(self._max_limit, self._limit + 1)
+            else:
+                self._limit = min(self._max_limit, self._limit + 1 / self._limit)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._condition.notify_all()
+
+
+def _url_template(request_url):
+    """
+    Groups request urls by endpoint, replacing the repositories, paths, build names... with a
+    ``*`` and keeping only the names of the query parameters, like ``api/storage/*?list&deep``.
+    """
+    static_segments = {"api", "storage", "metadata", "copy", "move", "build", "promote", "delete",
+                       "system", "ping", "version", "security", "encryptedPassword", "search", "aql",
+                       "access", "v1", "v2", "tokens", "lifecycle", "release_bundle", "records"}
+    parsed_url = urlparse(request_url)
+    segments = [segment for segment in parsed_url.path.split("/") if segment]
+    if "api" in segments:
+        segments = segments[segments.index("api"):]
+        if segments[0] == "api" and "lifecycle" in parsed_url.path:
+            segments.insert(0, "lifecycle")
+    template = []
+    for segment in segments:
+        if segment in static_segments:
+            template.append(segment)
+        elif template[-1:] != ["*"]:
+            template.append("*")
+    template = "/".join(template)
+    if parsed_url.query:
+        names = [param.partition("=")[0] for param in parsed_url.query.split("&") if param]
+        template += "?" + "&".join(names)
+    return template
+
+
+class _HttpTracer:
+    """
+    Records every request done to Artifactory and writes them, when the command finishes, as a
+    Chrome trace event file (chrome://tracing, https://ui.perfetto.dev) with one track per
+    thread. The time waiting for the per-server concurrency limit is traced as "queued".
+    A summary table per endpoint is also printed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._threads = {}
+        self._start = time.monotonic()
+        self.path = None
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def enable(self, path):
+        if self.path is None:
+            atexit.register(self.write)
+        self.path = path
+
+    def record(self, method, request_url, status, sent, received, queued, start, end, attempt,
+               error=None, saved=0):
+        """
+        ``sent`` and ``received`` are the bytes in the wire, ``saved`` the bytes that compression
+        saved in both directions.
+        """
+        with self._lock:
+            thread = self._threads.setdefault(threading.get_ident(), len(self._threads) + 1)
+            self._events.append({"method": method, "url": request_url, "template": _url_template(request_url),
+                                 "status": status, "sent": sent, "received": received, "saved": saved,
+                                 "queued": queued, "start": start, "end": end, "attempt": attempt,
+                                 "error": error, "thread": thread})
+
+    def _us(self, timestamp):
+        return round((timestamp - self._start) * 1e6)
+
+    def trace_events(self):
+        trace_events = []
+        for event in self._events:
+            name = f"{event['method']} {event['template']}"
+            if event["start"] - event["queued"] > 0.001:
+                trace_events.append({"name": f"queued {name}", "cat": "queue", "ph": "X",
+                                     "ts": self._us(event["queued"]),
+                                     "dur": self._us(event["start"]) - self._us(event["queued"]),
+                                     "pid": 1, "tid": event["thread"]})
+            args = {key: event[key] for key in ("url", "status", "sent", "received", "saved", "attempt", "error")}
+            args["queued_ms"] = round((event["start"] - event["queued"]) * 1000, 3)
+            trace_events.append({"name": name, "cat": "http", "ph": "X", "ts": self._us(event["start"]),
+                                 "dur": self._us(event["end"]) - self._us(event["start"]),
+                                 "pid": 1, "tid": event["thread"], "args": args})
+        return trace_events
+
+    def summary(self):
+        endpoints = {}
+        for event in self._events:
+            name = f"{event['method']} {event['template']}"
+            row = endpoints.setdefault(name, {"endpoint": name, "requests": 0, "retries": 0, "errors": 0,
+                                              "total_ms": 0.0, "max_ms": 0.0, "queued_ms": 0.0,
+                                              "sent": 0, "received": 0, "saved": 0})
+            elapsed = (event["end"] - event["start"]) * 1000
+            row["requests"] += 1
+            row["retries"] += 1 if event["attempt"] else 0
+            row["errors"] += 1 if event["error"] or (event["status"] or 0) >= 400 else 0
+            row["total_ms"] += elapsed
+            row["max_ms"] = max(row["max_ms"], elapsed)
+            row["queued_ms"] += (event["start"] - event["queued"]) * 1000
+            row["sent"] += event["sent"] or 0
+            row["received"] += event["received"] or 0
+            row["saved"] += event["saved"] or 0
+        return sorted(endpoints.values(), key=lambda r: r["total_ms"], reverse=True)
+
+    def write(self):
+        if not self.path:
+            return
+        with self._lock:
+            summary = self.summary()
+            trace = {"traceEvents": self.trace_events(), "displayTimeUnit": "ms", "summary": summary,
+                     "coalesced": _single_flight.saved}
+        with open(self.path, "w") as trace_file:
+            json.dump(trace, trace_file)
+
+        output = ConanOutput()
+        output.info(f"HTTP trace with {len(self._events)} requests saved to {self.path} "
+                    f"({_single_flight.saved} duplicated requests coalesced)")
+        output.info(f"{'endpoint':<60} {'requests':>8} {'retries':>7} {'errors':>6} {'total ms':>10} "
+                    f"{'avg ms':>8} {'max ms':>8} {'queued ms':>10} {'sent':>10} {'received':>10} "
+                    f"{'saved':>10}")
+        for row in summary:
+            output.info(f"{row['endpoint']:<60} {row['requests']:>8} {row['retries']:>7} {row['errors']:>6} "
+                        f"{row['total_ms']:>10.1f} {row['total_ms'] / row['requests']:>8.1f} "
+                        f"{row['max_ms']:>8.1f} {row['queued_ms']:>10.1f} {row['sent']:>10} {row['received']:>10} "
+                        f"{row['saved']:>10}")
+
+
+_http_tracer = _HttpTracer()
+
+
+class _Profiler:
+    """
+    Profile of a command, written as a JSON report when it finishes:
+
+    - phases: consecutive parts of the command (like loading the graph or serializing the output),
+      with their wall time, their peak of memory allocated (traced with ``tracemalloc``), and the
+      requests to Artifactory and bytes hashed while they run. A phase can be entered several times,
+      its values are accumulated.
+    - nodes: the work done for every graph node, possibly in concurrent threads, with its wall time,
+      the requests and bytes hashed by that thread and the time of its steps.
+    - steps: time of smaller operations inside the nodes (like hashing files), accumulated for all
+      the nodes and threads.
+    """
+    _COUNTERS = ("http_requests", "http_sent", "http_received", "hashed_bytes")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._totals = dict.fromkeys(self._COUNTERS, 0)
+        self._phases = {}
+        self._steps = {}
+        self._nodes = []
+        self._start = None
+        self._peak = 0
+        self.path = None
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def enable(self, path):
+        if self.path is None:
+            atexit.register(self.write)
+            tracemalloc.start()
+            self._start = time.perf_counter()
+        self.path = path
+
+    def count(self, counter, value=1):
+        if self.path is None:
+            return
+        with self._lock:
+            self._totals[counter] += value
+        node = getattr(self._local, "node", None)
+        if node is not None:  # only updated by its own thread
+            node[counter] += value
+
+    def count_http(self, sent, received):
+        self.count("http_requests")
+        self.count("http_sent", sent or 0)
+        self.count("http_received", received or 0)
+
+    @contextmanager
+    def phase(self, name):
+        if self.path is None:
+            yield
+            return
+        with self._lock:
+            before = dict(self._totals)
+        if hasattr(tracemalloc, "reset_peak"):  # Python >= 3.9, before the peak is the one of the command
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            with self._lock:
+                phase = self._phases.get(name)
+                if phase is None:
+                    phase = {"phase": name, "calls": 0, "seconds": 0.0, "peak_memory": 0,
+                             **dict.fromkeys(self._COUNTERS, 0)}
+                    self._phases[name] = phase
+                phase["calls"] += 1
+                phase["seconds"] += seconds
+                phase["peak_memory"] = max(phase["peak_memory"], peak)
+                for counter in self._COUNTERS:
+                    phase[counter] += self._totals[counter] - before[counter]
+                self._peak = max(self._peak, peak)
+
+    def iter_phase(self, name, iterable):
+        """ Yields the items of ``iterable``, profiling the time to get each of them as the phase ``name`` """
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    @contextmanager
+    def node(self, name):
+        if self.path is None:
+            yield
+            return
+        record = {"node": name, "seconds": 0.0, **dict.fromkeys(self._COUNTERS, 0), "steps": {}}
+        parent = getattr(self._local, "node", None)
+        self._local.node = record
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            self._local.node = parent
+            with self._lock:
+                self._nodes.append(record)
+
+    @contextmanager
+    def step(self, name):
+        if self.path is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            node = getattr(self._local, "node", None)
+            if node is not None:
+                node["steps"][name] = node["steps"].get(name, 0.0) + seconds
+            with self._lock:
+                self._steps[name] = self._steps.get(name, 0.0) + seconds
+
+    def report(self):
+        with self._lock:
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            return {"seconds": time.perf_counter() - self._start, "peak_memory": self._peak,
+                    **self._totals,
+                    "phases": list(self._phases.values()),
+                    "steps": [{"step": name, "seconds": seconds} for name, seconds in self._steps.items()],
+                    # the slowest nodes first
+                    "nodes": sorted(self._nodes, key=lambda n: n["seconds"], reverse=True)}
+
+    def write(self):
+        if not self.path:
+            return
+        report = self.report()
+        with open(self.path, "w") as report_file:
+            json.dump(report, report_file, indent=4)
+        ConanOutput().info(f"Profile report saved to {self.path}: {report['seconds']:.2f}s, "
+                           f"{report['http_requests']} requests to Artifactory, "
+                           f"{report['hashed_bytes']} bytes hashed, "
+                           f"{report['peak_memory'] / 1024 / 1024:.1f}MB peak memory")
+
+
+profiler = _Profiler()
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    return len(body.encode("utf-8") if isinstance(body, str) else body)
+
+
+class _SessionPool:
+    """
+    Keeps one ``requests.Session`` per Artifactory server (scheme + host), so all the requests of
+    a command reuse the same keep-alive connections instead of doing a new TCP+TLS handshake
+    for every call. The number of concurrent requests to the same server adapts to how the
+    server is responding (see ``_AdaptiveLimit``), up to the size of its connection pool, and
+    throttled requests are retried.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._host_limits = {}
+        self.pool_maxsize = 10
+        self.keep_alive = True
+        self.timeout = None
+        self.max_retries = 5
+        self.slow_response = 10.0
+
+    def configure(self, pool_maxsize=None, keep_alive=None, timeout=None, max_retries=None,
+                  slow_response=None):
+        with self._lock:
+            if pool_maxsize is not None:
+                self.pool_maxsize = max(1, int(pool_maxsize))
+            if keep_alive is not None:
+                self.keep_alive = bool(keep_alive)
+            if timeout is not None:
+                self.timeout = float(timeout)
+            if max_retries is not None:
+                self.max_retries = max(0, int(max_retries))
+            if slow_response is not None:
+                self.slow_response = float(slow_response)
+            # sessions have to be recreated to apply the new pool size
+            self._close_sessions()
+
+    @staticmethod
+    def _host(request_url):
+        parsed_url = urlparse(request_url)
+        return f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+    def _host_limit(self, request_url):
+        key = self._host(request_url)
+        with self._lock:
+            limit = self._host_limits.get(key)
+            if limit is None:
+                limit = _AdaptiveLimit(self.pool_maxsize, self.slow_response)
+                self._host_limits[key] = limit
+            return limit
+
+    def get(self, request_url):
+        key = self._host(request_url)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+                session.mount(f"{key}/", adapter)
+                self._sessions[key] = session
+            return session
 
-    requests_method = getattr(requests, method)
-    if user and password:
-        response = requests_method(request_url, auth=(
-            user, password), data=json_data, headers=headers)
-    else:
-        response = requests_method(request_url)
+    def _send(self, method, request_url, **kwargs):
+        if not self.keep_alive:
+            # A throwaway session for each request, always opening a new connection
+            return requests.request(method, request_url, timeout=self.timeout, **kwargs)
+        return self.get(request_url).request(method, request_url, timeout=self.timeout, **kwargs)
 
+    def request(self, method, request_url, body_size=None, **kwargs):
+        """
+        ``body_size`` is the size of the body before compressing it, if it was compressed.
+        """
+        limit = self._host_limit(request_url)
+        sent = _body_size(kwargs.get("data"))
+        saved = body_size - sent if body_size is not None else 0
+        attempt = 0
+        queued = time.monotonic()
+        while True:
+            if isinstance(kwargs.get("auth"), AccessToken):
+                # before taking a slot, refreshing needs another request to the same server
+                kwargs["auth"].refresh_if_expired()
+            limit.acquire()
+            start = time.monotonic()
+            try:
+                response = self._send(method, request_url, **kwargs)
+            except Exception as e:
+                end = time.monotonic()
+                limit.release(end - start, throttled=True)
+                if _http_tracer.enabled:
+                    _http_tracer.record(method, request_url, None, sent, None,
+                                        queued, start, end, attempt, error=str(e))
+                profiler.count_http(sent, None)
+                raise
+            end = time.monotonic()
+            if _http_tracer.enabled or profiler.enabled:
+                if kwargs.get("stream"):
+                    # streamed responses are not downloaded yet, rely on the declared length
+                    received = int(response.headers.get("Content-Length") or 0)
+                    decoded = received
+                else:
+                    decoded = len(response.content)
+                    received = response.raw.tell() or decoded
+                if _http_tracer.enabled:
+                    _http_tracer.record(method, request_url, response.status_code, sent, received, queued,
+                                        start, end, attempt, saved=saved + decoded - received)
+                profiler.count_http(sent, received)
+            throttled = response.status_code in _THROTTLING_STATUS_CODES
+            retry_after = _get_retry_after(response) if throttled else None
+            if throttled and retry_after is None:
+                retry_after = min(0.5 * 2 ** attempt, _MAX_RETRY_AFTER)
+            limit.release(end - start, throttled=throttled, retry_after=retry_after)
+            if not throttled or attempt >= self.max_retries:
+                return response
+            response.close()
+            attempt += 1
+            queued = time.monotonic()
+            ConanOutput().verbose(f"Artifactory answered {response.status_code} to {method} {request_url}, "
+                                  f"retrying in {retry_after:.1f}s ({attempt}/{self.max_retries}), "
+                                  f"concurrency limit is now {limit.limit}")
+
+    def _close_sessions(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions = {}
+        self._host_limits = {}
+
+    def close(self):
+        with self._lock:
+            self._close_sessions()
+
+
+_session_pool = _SessionPool()
+
+
+def add_http_arguments(subparser):
+    subparser.add_argument("--trace-http", default=None,
+                           help="Save a trace of all the requests to Artifactory to this file, in Chrome "
+                                "trace event format, and print a summary per endpoint. Default: "
+                                "user.art:trace_http conf.")
+
+
+def configure_http(conan_api, args=None):
+    """
+    Applies the ``user.art:*`` HTTP configuration from the Conan global.conf and the
+    command arguments added with ``add_http_arguments``:
+
+    - ``user.art:pool_maxsize``: maximum number of pooled connections per server (default 10).
+    - ``user.art:keep_alive``: reuse connections between requests (default True).
+    - ``user.art:timeout``: timeout in seconds for each request (default no timeout).
+    - ``user.art:max_retries``: retries for requests throttled with a 429/503 (default 5).
+    - ``user.art:slow_response``: seconds after which a response is considered slow and the
+      concurrency to that server is reduced (default 10).
+    - ``user.art:trace_http``: file to save the trace of the requests (see ``_HttpTracer``).
+    - ``user.art:json_backend``: ``orjson``, ``ujson`` or ``json`` (the standard library) to parse
+      and serialize JSON (see ``_JsonCodec``). Default: the first one installed.
+
+    It also enables the ``profiler`` if the command has a ``--profile-report`` argument.
+    """
+    config = conan_api.config
+    _session_pool.configure(pool_maxsize=config.get("user.art:pool_maxsize", check_type=int),
+                            keep_alive=config.get("user.art:keep_alive", check_type=bool),
+                            timeout=config.get("user.art:timeout"),
+                            max_retries=config.get("user.art:max_retries", check_type=int),
+                            slow_response=config.get("user.art:slow_response"))
+    trace_http = getattr(args, "trace_http", None) or config.get("user.art:trace_http", check_type=str)
+    if trace_http:
+        _http_tracer.enable(os.path.abspath(trace_http))
+    profile_report = getattr(args, "profile_report", None)
+    if profile_report:
+        profiler.enable(os.path.abspath(profile_report))
+    json_codec.configure(config.get("user.art:json_backend", check_type=str))
+
+
+class RequestExecutor:
+    """
+    Runs batches of tasks doing ``api_request`` calls on a bounded thread pool. Results are
+    returned in the same order as the tasks, as ``(result, error)`` tuples, so callers can report
+    them exactly as if they had been run one after another.
+    """
+
+    def __init__(self, jobs=1):
+        self.jobs = max(1, int(jobs or 1))
+
+    @staticmethod
+    def _call(func, item):
+        try:
+            return func(item), None
+        except Exception as e:
+            return None, e
+
+    def run(self, func, items):
+        """
+        Calls ``func(item)`` for every item. When running serially (``jobs=1``) it stops at the
+        first error, like a plain loop would do, so the returned list may be shorter than ``items``.
+        ``items`` is consumed lazily, with a bounded number of tasks queued at any time, so it can
+        be a generator still receiving data from the server.
+        """
+        return list(self.imap(func, items))
+
+    def imap(self, func, items):
+        """
+        Lazy version of ``run``, yielding the ``(result, error)`` tuples in order as they are ready,
+        so the results can be consumed (and released) while the next tasks are still running.
+        Like when running serially, it stops at the first error: no more tasks are started after a
+        failure and the results are yielded up to the first error.
+        """
+        if self.jobs == 1:
+            for item in items:
+                result = self._call(func, item)
+                yield result
+                if result[1] is not None:
+                    return
+            return
+        first_error = [float("inf")]
+        lock = threading.Lock()
+
+        def _task(index, item):
+            # The tasks after a failed one are not run, as they would not be in a serial loop
+            if index > first_error[0]:
+                return None, None
+            result = self._call(func, item)
+            if result[1] is not None:
+                with lock:
+                    first_error[0] = min(first_error[0], index)
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            pending = deque()
+            try:
+                for index, item in enumerate(items):
+                    if first_error[0] < index:
+                        break
+                    pending.append(pool.submit(_task, index, item))
+                    if len(pending) >= 2 * self.jobs:
+                        result = pending.popleft().result()
+                        yield result
+                        if result[1] is not None:
+                            return
+                while pending:
+                    result = pending.popleft().result()
+                    yield result
+                    if result[1] is not None:
+                        return
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+def get_executor(conan_api, jobs=None):
+    """
+    Returns a ``RequestExecutor`` using ``jobs`` threads, or the ``user.art:jobs`` conf value
+    if not given. By default, requests are done serially.
+    """
+    if jobs is None:
+        jobs = conan_api.config.get("user.art:jobs", default=1, check_type=int)
+    return RequestExecutor(jobs)
+
+
+def raise_first_error(results):
+    for _, error in results:
+        if error is not None:
+            raise error
+
+
+def _check_response(response):
     if response.status_code == 400:
         raise BadRequestException(response_to_str(response))
     elif response.status_code == 401:
@@ -87,7 +784,308 @@ def api_request(method, request_url, user=None, password=None, json_data=None,
     elif response.status_code not in [200, 201, 204]:
         raise UnexpectedResponseException(response_to_str(response))
 
-    return response_to_str(response)
+
+def _base_url(url):
+    """ The Access and Lifecycle APIs live in the root of the server, not under ``/artifactory`` """
+    parsed_url = urlparse(url)
+    return f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+
+def _token_data(response):
+    data = json.loads(response_to_str(response))
+    expires_in = data.get("expires_in")
+    return {"access_token": data["access_token"],
+            "refresh_token": data.get("refresh_token"),
+            "expires_in": expires_in,
+            "expires_at": time.time() + expires_in if expires_in else None}
+
+
+def create_access_token(url, user, password, scope="applied-permissions/user", expires_in=3600):
+    """
+    Creates a refreshable scoped access token with the Access API, authenticating with the user
+    and password (or API key/identity token). Returns the token data to store with the server.
+    """
+    token_json = {"scope": scope, "expires_in": expires_in, "refreshable": True}
+    response = _session_pool.request("POST", f"{_base_url(url)}/access/api/v1/tokens", auth=(user, password),
+                                     json=token_json)
+    _check_response(response)
+    return _token_data(response)
+
+
+class AccessToken(requests.auth.AuthBase):
+    """
+    Scoped access token sent as ``Authorization: Bearer`` instead of the basic authentication of
+    every request, that Artifactory has to verify each time. It is refreshed with its refresh token
+    before it expires, and ``on_refresh`` is called with the new token data so it can be stored.
+    It can be passed as the ``password`` of ``api_request`` and shared between threads.
+    """
+
+    _refresh_margin = 60
+
+    def __init__(self, url, token_data, on_refresh=None):
+        self._lock = threading.Lock()
+        self._url = url
+        self._token_data = token_data
+        self._on_refresh = on_refresh
+
+    def _expired(self):
+        expires_at = self._token_data.get("expires_at")
+        if not expires_at or not self._token_data.get("refresh_token"):
+            return False
+        # Refresh a bit earlier than the expiration, without refreshing short-lived tokens all the time
+        margin = min(self._refresh_margin, (self._token_data.get("expires_in") or 0) / 10)
+        return time.time() > expires_at - margin
+
+    def _refresh(self):
+        refresh_data = {"grant_type": "refresh_token",
+                        "refresh_token": self._token_data["refresh_token"],
+                        "access_token": self._token_data["access_token"]}
+        response = _session_pool.request("POST", f"{_base_url(self._url)}/access/api/v1/tokens",
+                                         data=refresh_data)
+        try:
+            _check_response(response)
+        except ConanException as e:
+            raise ConanException(f"Could not refresh the access token for {self._url}: {e}. "
+                                 f"Add the server again with `conan art:server add`.")
+        self._token_data = _token_data(response)
+        ConanOutput().verbose(f"Access token for {self._url} refreshed")
+        if self._on_refresh is not None:
+            self._on_refresh(self._token_data)
+
+    def refresh_if_expired(self):
+        with self._lock:
+            if self._expired():
+                self._refresh()
+
+    def __call__(self, request):
+        with self._lock:
+            request.headers["Authorization"] = f"Bearer {self._token_data['access_token']}"
+        return request
+
+
+def _get_auth(user, password):
+    if isinstance(password, AccessToken):
+        return password
+    return (user, password) if user and password else None
+
+
+class _SingleFlight:
+    """
+    Coalesces concurrent identical requests: while a request is in flight, the same request
+    from other threads waits for it and gets its result (or exception), instead of doing another
+    round trip to the server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.saved = 0
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+            else:
+                self.saved += 1
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = func()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["event"].set()
+
+    def report(self):
+        if self.saved:
+            ConanOutput().verbose(f"{self.saved} duplicated concurrent requests to Artifactory were coalesced")
+
+
+_single_flight = _SingleFlight()
+atexit.register(_single_flight.report)
+
+
+def api_request(method, request_url, user=None, password=None, json_data=None,
+                sign_key_name=None, compress=False, content_type="application/json"):
+    """
+    Responses are always requested with gzip compression (``Accept-Encoding``), that requests
+    decodes transparently. With ``compress`` the ``json_data`` body is also sent gzipped.
+    """
+    headers = {}
+    body_size = None
+    if json_data:
+        headers.update({"Content-Type": content_type})
+        if compress:
+            body_size = _body_size(json_data)
+            json_data = gzip.compress(json_data.encode("utf-8") if isinstance(json_data, str) else json_data,
+                                      compresslevel=6)
+            headers.update({"Content-Encoding": "gzip"})
+    if sign_key_name:
+        headers.update({"X-JFrog-Crypto-Key-Name": sign_key_name})
+
+    auth = _get_auth(user, password)
+
+    def _request():
+        response = _session_pool.request(method.upper(), request_url, auth=auth, data=json_data, headers=headers,
+                                         body_size=body_size)
+        _check_response(response)
+        return response_to_str(response)
+
+    if method.lower() == "get" and not json_data:
+        return _single_flight.do((request_url, user, password), _request)
+    return _request()
+
+
+class _JsonStream:
+    """
+    Incremental parser that yields the entries of one array or object nested in JSON objects by
+    the ``keys`` path, like the ``files`` of a storage list response or the ``graph`` ``nodes`` of a
+    Conan graph json, as the chunks arrive. Array entries are yielded as values and object entries
+    as ``(key, value)`` tuples. Only one entry (and one chunk) is kept in memory at a time. The
+    values of other keys found on the way are parsed and discarded.
+    """
+
+    _compact_threshold = 1 << 16
+
+    def __init__(self, chunks, *keys):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder = json.JSONDecoder()
+        self._keys = keys
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _read_more(self):
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            text = self._decoder.decode(b"", final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        if self._pos > self._compact_threshold:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        self._buffer += text
+        return True
+
+    def _next_char(self):
+        """ Skips whitespace and returns the next character without consuming it """
+        while True:
+            buffer = self._buffer
+            while self._pos < len(buffer) and buffer[self._pos] in " \t\n\r":
+                self._pos += 1
+            if self._pos < len(buffer):
+                return buffer[self._pos]
+            if not self._read_more():
+                raise json.JSONDecodeError("Unexpected end of JSON data", buffer, self._pos)
+
+    def _expect(self, chars):
+        char = self._next_char()
+        if char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of '{chars}'", self._buffer, self._pos)
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._next_char()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+                # A number not followed by a delimiter could be truncated at the end of the buffer,
+                # like "-2." or "1e-" decoded as -2 and 1
+                if self._eof or isinstance(value, bool) or not isinstance(value, (int, float)) \
+                        or (end < len(self._buffer) and self._buffer[end] in " \t\n\r,]}"):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._read_more()
+
+    def _find_key(self, key):
+        """ Moves to the value of ``key`` in the object being parsed, False if it is not there """
+        self._expect("{")
+        if self._next_char() == "}":
+            return False
+        while True:
+            if self._value() == key:
+                self._expect(":")
+                return True
+            self._expect(":")
+            self._value()
+            if self._expect(",}") == "}":
+                return False
+
+    def __iter__(self):
+        for key in self._keys:
+            if not self._find_key(key):
+                return
+        char = self._next_char()
+        if char == "[":
+            self._expect("[")
+            if self._next_char() == "]":
+                return
+            while True:
+                yield self._value()
+                if self._expect(",]") == "]":
+                    return
+        elif char == "{":
+            self._expect("{")
+            if self._next_char() == "}":
+                return
+            while True:
+                key = self._value()
+                self._expect(":")
+                yield key, self._value()
+                if self._expect(",}") == "}":
+                    return
+
+
+def api_request_items(request_url, key, user=None, password=None):
+    """
+    Streaming version of a GET ``api_request`` for JSON responses with a potentially big array,
+    like the ``files`` of ``api/storage/...?list``. Yields the entries of the ``key`` array while
+    the response is being downloaded.
+    """
+    auth = _get_auth(user, password)
+    response = _session_pool.request("GET", request_url, auth=auth, stream=True)
+    try:
+        _check_response(response)
+        try:
+            yield from _JsonStream(response.iter_content(chunk_size=1 << 16), key)
+        except json.JSONDecodeError as e:
+            raise ConanException(f"Error parsing the response from {request_url}: {e}")
+    finally:
+        response.close()
+
+
+def aql_search(url, query, user=None, password=None, page_size=1000):
+    """
+    Runs an AQL ``items.find(...)`` query, that must be sorted for a stable pagination, yielding
+    its results from pages of ``page_size`` items.
+    """
+    offset = 0
+    while True:
+        response = api_request("post", f"{url}/api/search/aql", user, password,
+                               json_data=f"{query}.offset({offset}).limit({page_size})", content_type="text/plain")
+        results = json_codec.loads(response).get("results", [])
+        yield from results
+        if len(results) < page_size:
+            return
+        offset += page_size
 
 
 def assert_server_or_url_user_password(args):
@@ -0,0 +1,353 @@
+import fnmatch
+import gzip
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+# Fields of the items (primary) domain of AQL
+_AQL_ITEM_FIELDS = {"repo", "path", "name", "type", "size", "created", "modified", "updated", "depth",
+                    "actual_md5", "actual_sha1", "sha256", "original_md5", "original_sha1"}
+
+
+def _aql_match(item, properties, criteria):
+    for key, value in criteria.items():
+        if key == "$and":
+            matched = all(_aql_match(item, properties, c) for c in value)
+        elif key == "$or":
+            matched = any(_aql_match(item, properties, c) for c in value)
+        else:
+            if key.startswith("@"):
+                actual = properties.get(key[1:], [])
+            else:
+                actual = [item.get(key)]
+            if isinstance(value, dict) and "$match" in value:
+                matched = any(a is not None and fnmatch.fnmatchcase(a, value["$match"]) for a in actual)
+            else:
+                expected = value["$eq"] if isinstance(value, dict) else value
+                matched = expected in actual
+        if not matched:
+            return False
+    return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # headers and body are written separately, avoid Nagle delays on keep-alive connections
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.artifactory.lock:
+            self.server.artifactory.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self):
+        artifactory = self.server.artifactory
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query, keep_blank_values=True)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        with artifactory.lock:
+            artifactory.requests.append((self.command, self.path))
+            artifactory.authorizations.append((self.headers.get("Authorization") or " ").split(" ")[0])
+            artifactory.received_bytes += length
+            injected_status = artifactory.injected_error() or artifactory.check_authorization(
+                self.headers.get("Authorization"))
+        if artifactory.latency:
+            time.sleep(artifactory.latency)
+        headers = {}
+        if injected_status is not None:
+            messages = {401: "Bad credentials", 429: "Too many requests"}
+            status, payload = injected_status, messages.get(injected_status, "Service unavailable")
+            if artifactory.retry_after is not None:
+                headers["Retry-After"] = str(artifactory.retry_after)
+        else:
+            status, payload = artifactory.handle(self.command, unquote(parsed.path), query, body)
+        if isinstance(payload, (dict, list)):
+            content = json.dumps(payload).encode("utf-8")
+            content_type = "application/json"
+        else:
+            content = (payload or "").encode("utf-8")
+            content_type = "text/plain"
+        if len(content) > 1024 and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            content = gzip.compress(content)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_PUT = do_POST = do_PATCH = do_DELETE = _dispatch
+
+
+class FakeArtifactory:
+    """
+    In-process stand-in of the Artifactory REST API used by the art:* commands: storage, metadata,
+    copy, search (AQL), build, system, security, access tokens and lifecycle (release bundles v2) endpoints.
+    Artifacts live in memory, keyed by their "<repo>/<path>" like in Artifactory.
+    Any basic authentication is accepted, Bearer tokens must have been issued and not be expired.
+    The files of the ``virtual_repos`` are not found by AQL searches, like in Artifactory.
+
+    ``latency`` (seconds) is added to every response. ``error_rate`` is the probability of
+    answering any request with ``error_status`` and ``throttle()`` rejects the next requests.
+    """
+
+    def __init__(self, latency=0, error_rate=0.0, error_status=503, seed=0):
+        self.lock = threading.Lock()
+        self.files = {}
+        self.virtual_repos = set()
+        self.connections = 0
+        self.requests = []
+        self.throttled_responses = 0
+        self.throttle_status = 429
+        self.retry_after = None
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self.received_bytes = 0
+        self.builds = {}
+        self.release_bundles = {}
+        self.authorizations = []
+        self.access_tokens = {}
+        self.refresh_tokens = {}
+        self._token_count = 0
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/artifactory"
+
+    def __enter__(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.artifactory = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_stats(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = []
+            self.authorizations = []
+            self.received_bytes = 0
+
+    def throttle(self, responses, status=429, retry_after=None):
+        """ The next ``responses`` requests will be rejected with ``status`` """
+        with self.lock:
+            self.throttled_responses = responses
+            self.throttle_status = status
+            self.retry_after = retry_after
+
+    def injected_error(self):
+        """ Status code of the error to answer to the current request, if any """
+        if self.throttled_responses > 0:
+            self.throttled_responses -= 1
+            return self.throttle_status
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self.error_status
+        return None
+
+    def check_authorization(self, authorization):
+        """ Status code of the error to answer to a request with this Authorization header, if any """
+        if authorization and authorization.startswith("Bearer "):
+            expires_at = self.access_tokens.get(authorization[len("Bearer "):])
+            if expires_at is None or expires_at < time.time():
+                return 401
+        return None
+
+    def add_file(self, path, content=b""):
+        self.files[path] = {"checksums": {"md5": hashlib.md5(content).hexdigest(),
+                                          "sha1": hashlib.sha1(content).hexdigest(),
+                                          "sha256": hashlib.sha256(content).hexdigest()},
+                            "size": len(content),
+                            "properties": {}}
+
+    def _children(self, path):
+        prefix = path.rstrip("/") + "/"
+        return {p: f for p, f in self.files.items() if p.startswith(prefix)}
+
+    def handle(self, method, path, query, body):
+        for api in ("/artifactory/api/", "/lifecycle/api/v2/", "/access/api/v1/"):
+            if path.startswith(api):
+                break
+        else:
+            return 404, {"errors": [{"status": 404, "message": "Not found"}]}
+        endpoint, _, rest = path[len(api):].partition("/")
+        handler = getattr(self, f"_{method.lower()}_{endpoint}", None)
+        if handler is None:
+            return 404, {"errors": [{"status": 404, "message": f"Unknown endpoint {endpoint}"}]}
+        with self.lock:
+            return handler(rest, query, body)
+
+    def _get_system(self, rest, query, body):
+        if rest == "ping":
+            return 200, "OK"
+        return 200, {"version": "7.0.0", "license": "Enterprise"}
+
+    def _get_security(self, rest, query, body):
+        return 200, "encrypted-password"
+
+    def _post_tokens(self, rest, query, body):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+        if data.get("grant_type") == "refresh_token":
+            expires_in = self.refresh_tokens.pop(data["refresh_token"], None)
+            if expires_in is None or self.access_tokens.pop(data["access_token"], None) is None:
+                return 401, {"errors": [{"status": 401, "message": "Invalid refresh token"}]}
+        else:
+            expires_in = data.get("expires_in", 3600)
+        self._token_count += 1
+        access_token, refresh_token = f"access-{self._token_count}", f"refresh-{self._token_count}"
+        self.access_tokens[access_token] = time.time() + expires_in
+        self.refresh_tokens[refresh_token] = expires_in
+        return 200, {"token_id": str(self._token_count), "access_token": access_token,
+                     "refresh_token": refresh_token, "expires_in": expires_in,
+                     "scope": data.get("scope", "applied-permissions/user"), "token_type": "Bearer"}
+
+    def _post_search(self, rest, query, body):
+        """ AQL ``items.find(criteria).include(...).sort(...).offset(n).limit(n)`` queries """
+        aql = body.decode("utf-8")
+        if rest != "aql" or not aql.startswith("items.find("):
+            return 400, {"errors": [{"status": 400, "message": "Unsupported search"}]}
+        criteria, end = json.JSONDecoder().raw_decode(aql, len("items.find("))
+        modifiers = dict(re.findall(r"\.(include|sort|offset|limit)\((.*?)\)(?=\.|$)", aql[end + 1:]))
+        include = json.loads(f"[{modifiers['include']}]") if "include" in modifiers else None
+        # Like Artifactory, that only supports them when all the included fields are of the items domain
+        if include is not None and any(field not in _AQL_ITEM_FIELDS for field in include) \
+                and any(modifier in modifiers for modifier in ("sort", "offset", "limit")):
+            return 400, {"errors": [{"status": 400, "message": "Sort, offset and limit are only supported when "
+                                                              "including fields of the primary domain"}]}
+        items = []
+        for path, artifact in self.files.items():
+            repo, _, item_path = path.partition("/")
+            if repo in self.virtual_repos:
+                continue
+            folder, _, name = item_path.rpartition("/")
+            item = {"repo": repo, "path": folder or ".", "name": name, "type": "file", "size": artifact["size"],
+                    "actual_md5": artifact["checksums"]["md5"], "actual_sha1": artifact["checksums"]["sha1"],
+                    "sha256": artifact["checksums"]["sha256"]}
+            if _aql_match(item, artifact["properties"], criteria):
+                result = {k: v for k, v in item.items() if include is None or k in include}
+                if include is not None and "property" in include and artifact["properties"]:
+                    result["properties"] = [{"key": key, "value": value}
+                                            for key, values in artifact["properties"].items() for value in values]
+                items.append(result)
+        if "sort" in modifiers:
+            fields = json.loads(modifiers["sort"])["$asc"]
+            items.sort(key=lambda i: [i.get(field) for field in fields])
+        offset = int(modifiers.get("offset", 0))
+        limit = int(modifiers.get("limit", len(items)))
+        results = items[offset:offset + limit]
+        return 200, {"results": results,
+                     "range": {"start_pos": offset, "end_pos": offset + len(results), "total": len(results)}}
+
+    def _get_storage(self, path, query, body):
+        path = path.rstrip("/")
+        if "list" in query:
+            children = self._children(path)
+            if not children:
+                return 404, {"errors": [{"status": 404, "message": "Not found"}]}
+            files = [{"uri": p[len(path):], "size": f["size"], "folder": False} for p, f in children.items()]
+            return 200, {"uri": path, "created": "2024-01-01T00:00:00.000Z", "files": files}
+        artifact = self.files.get(path)
+        if "properties" in query:
+            if artifact is None or not artifact["properties"]:
+                return 404, {"errors": [{"status": 404, "message": "No properties could be found."}]}
+            return 200, {"uri": path, "properties": artifact["properties"]}
+        if artifact is not None:
+            return 200, {"repo": path.split("/")[0], "path": path, "size": artifact["size"],
+                         "checksums": artifact["checksums"]}
+        if self._children(path):
+            return 200, {"repo": path.split("/")[0], "path": path, "children": []}
+        return 404, {"errors": [{"status": 404, "message": "Unable to find item"}]}
+
+    def _patch_metadata(self, path, query, body):
+        props = json.loads(body)["props"]
+        targets = [path] if path in self.files else []
+        if query.get("recursiveProperties", ["0"])[0] == "1" or not targets:
+            targets += list(self._children(path))
+        if not targets:
+            return 404, {"errors": [{"status": 404, "message": "Not found"}]}
+        for target in targets:
+            properties = self.files[target]["properties"]
+            for key, value in props.items():
+                properties[key] = value if isinstance(value, list) else [value]
+        return 204, ""
+
+    def _get_build(self, rest, query, body):
+        build_info = self.builds.get(tuple(rest.split("/")))
+        if build_info is None:
+            return 404, {"errors": [{"status": 404, "message": f"No build was found for build {rest}"}]}
+        return 200, {"uri": f"{self.url}/api/build/{rest}", "buildInfo": build_info}
+
+    def _put_build(self, rest, query, body):
+        build_info = json.loads(body)
+        self.builds[(build_info["name"], build_info["number"])] = build_info
+        return 204, ""
+
+    def _post_build(self, rest, query, body):
+        data = json.loads(body)
+        if rest == "delete":
+            for number in data["buildNumbers"]:
+                self.builds.pop((data["buildName"], number), None)
+            return 200, ""
+        build_name, build_number = rest[len("promote/"):].split("/")
+        build_info = self.builds.get((build_name, build_number))
+        if build_info is None:
+            return 404, {"errors": [{"status": 404, "message": "Cannot find build"}]}
+        source, target = data["sourceRepo"], data["targetRepo"]
+        for module in build_info.get("modules", []):
+            for artifact in module.get("artifacts", []):
+                path = artifact.get("path", "")
+                if path.startswith(f"{source}/") and path in self.files:
+                    self.files[f"{target}/{path[len(source) + 1:]}"] = json.loads(json.dumps(self.files[path]))
+        return 200, {"messages": []}
+
+    def _post_release_bundle(self, rest, query, body):
+        data = json.loads(body)
+        key = (data["release_bundle_name"], data["release_bundle_version"])
+        self.release_bundles[key] = data
+        return 201, {"repository_key": "release-bundles-v2", "release_bundle_name": key[0],
+                     "release_bundle_version": key[1], "created": "2024-01-01T00:00:00.000Z"}
+
+    def _delete_release_bundle(self, rest, query, body):
+        _, name, version = rest.split("/")
+        if self.release_bundles.pop((name, version), None) is None:
+            return 404, {"errors": [{"status": 404, "message": "Release bundle not found"}]}
+        return 204, ""
+
+    def _post_copy(self, path, query, body):
+        destination = query["to"][0].lstrip("/")
+        sources = {path: self.files[path]} if path in self.files else self._children(path)
+        if not sources:
+            # Artifactory answers a Bad Request when the copy source does not exist
+            return 400, {"errors": [{"status": 400, "message": f"Could not find {path}"}]}
+        for source, artifact in sources.items():
+            self.files[destination + source[len(path):]] = json.loads(json.dumps(artifact))
+        return 200, {"messages": [{"level": "INFO", "message": "copying finished successfully"}]}
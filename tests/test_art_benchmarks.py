@@ -0,0 +1,351 @@
+"""
+Performance benchmarks of the art:* commands against the in-process FakeArtifactory, on synthetic
+inputs. They run with small inputs by default, to check that they keep working. To measure:
+
+    ART_BENCHMARK_SIZES=1000,10000,50000 ART_BENCHMARK_LATENCY=0.005 pytest -s tests/test_art_benchmarks.py
+
+- ``ART_BENCHMARK_SIZES``: comma separated number of artifacts of the synthetic inputs. Default: 120.
+- ``ART_BENCHMARK_LATENCY``: seconds of latency added to every response of the server. Default: 0.
+- ``ART_BENCHMARK_ERROR_RATE``: probability of the server answering any request with a 503. Default: 0.
+- ``ART_BENCHMARK_JOBS``: value for the ``--jobs`` argument of the commands that have it. Default: 1.
+- ``ART_BENCHMARK_GRAPH_MB``: size in MB of the synthetic graph json to load. Default: 5.
+- ``ART_BENCHMARK_REPORT``: JSON lines file where the results are appended.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pytest
+
+from fake_artifactory import FakeArtifactory
+from tools import load, run, save
+
+SIZES = [int(size) for size in os.getenv("ART_BENCHMARK_SIZES", "120").split(",")]
+LATENCY = float(os.getenv("ART_BENCHMARK_LATENCY", "0"))
+ERROR_RATE = float(os.getenv("ART_BENCHMARK_ERROR_RATE", "0"))
+JOBS = int(os.getenv("ART_BENCHMARK_JOBS", "1"))
+GRAPH_MB = float(os.getenv("ART_BENCHMARK_GRAPH_MB", "5"))
+
+
+@pytest.fixture(autouse=True)
+def conan_test():
+    old_env = dict(os.environ)
+    conan_home = tempfile.mkdtemp(suffix='conans')
+    env_vars = {"CONAN_HOME": conan_home}
+    os.environ.update(env_vars)
+    current = tempfile.mkdtemp(suffix="conans")
+    cwd = os.getcwd()
+    os.chdir(current)
+
+    repo = os.path.join(os.path.dirname(__file__), "..")
+    run(f"conan config install {repo}")
+    run("conan profile detect")
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(old_env)
+
+
+def _report(result):
+    report = os.getenv("ART_BENCHMARK_REPORT")
+    if report:
+        with open(report, "a") as report_file:
+            report_file.write(json.dumps(result) + "\n")
+
+
+def _benchmark(name, size, artifactory, cmd):
+    artifactory.reset_stats()
+    start = time.perf_counter()
+    run(cmd)
+    elapsed = time.perf_counter() - start
+    result = {"benchmark": name, "artifacts": size, "jobs": JOBS, "latency": LATENCY, "error_rate": ERROR_RATE,
+              "requests": len(artifactory.requests), "connections": artifactory.connections,
+              "seconds": round(elapsed, 3)}
+    print(f"BENCHMARK {name:<24} artifacts={size:<7} requests={result['requests']:<7} "
+          f"connections={result['connections']:<5} time={elapsed:.2f}s")
+    _report(result)
+    return result
+
+
+def _credentials(artifactory):
+    return f"--url={artifactory.url} --user=admin --password=password"
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_benchmark_promote(size):
+    packages = [f"pkgid{i}" for i in range(max(1, (size - 2) // 3))]
+    revisions = {"rrev": {"timestamp": 1.0,
+                          "packages": {pkgid: {"revisions": {"prev": {"timestamp": 1.0}}, "info": {}}
+                                       for pkgid in packages}}}
+    save("pkglist.json", json.dumps({"remote": {"pkg/1.0": {"revisions": revisions}}}))
+    with FakeArtifactory(latency=LATENCY, error_rate=ERROR_RATE) as artifactory:
+        for file in ("conanfile.py", "conanmanifest.txt"):
+            artifactory.add_file(f"stg/_/pkg/1.0/_/rrev/export/{file}")
+        for pkgid in packages:
+            for file in ("conan_package.tgz", "conaninfo.txt", "conanmanifest.txt"):
+                artifactory.add_file(f"stg/_/pkg/1.0/_/rrev/package/{pkgid}/prev/{file}")
+        result = _benchmark("promote", size, artifactory,
+                            f"conan art:promote pkglist.json --from=stg --to=prod {_credentials(artifactory)} "
+                            f"--jobs={JOBS}")
+        assert len([f for f in artifactory.files if f.startswith("prod/")]) == 2 + 3 * len(packages)
+        if not ERROR_RATE:  # otherwise retried requests are counted too
+            assert result["requests"] == 1 + 2 * (1 + 3 * len(packages))
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_benchmark_property_add(size):
+    with FakeArtifactory(latency=LATENCY, error_rate=ERROR_RATE) as artifactory:
+        for i in range(size):
+            artifactory.add_file(f"repo/_/pkg/1.0/_/rrev/package/pkgid{i // 3}/prev/file{i % 3}")
+        _benchmark("property add", size, artifactory,
+                   f"conan art:property add repo pkg/1.0#rrev {_credentials(artifactory)} "
+                   f"--property=build.name=bench --jobs={JOBS}")
+        assert all(f["properties"]["build.name"] == ["bench"] for f in artifactory.files.values())
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_benchmark_keep_alive(size):
+    """ The same art:property add with the pooled keep-alive connections and opening one per request """
+    with FakeArtifactory(latency=LATENCY, error_rate=ERROR_RATE) as artifactory:
+        for i in range(size):
+            artifactory.add_file(f"repo/_/pkg/1.0/_/rrev/package/pkgid{i // 3}/prev/file{i % 3}")
+        cmd = f"conan art:property add repo pkg/1.0#rrev {_credentials(artifactory)} --property=build.name=bench " \
+              f"--jobs={JOBS}"
+        pooled = _benchmark("property add keep-alive", size, artifactory, cmd)
+        save(os.path.join(os.environ["CONAN_HOME"], "global.conf"), "user.art:keep_alive=False\n")
+        no_pool = _benchmark("property add no keep-alive", size, artifactory, cmd)
+        assert no_pool["connections"] == no_pool["requests"]
+        assert pooled["connections"] < no_pool["connections"]
+
+
+def _synthetic_graph(artifactory, size):
+    """
+    Graph of an application with a dependency on a few base libraries, that every other node
+    depends on too. All the nodes share a recipe exported to the cache, with different binaries.
+    Every node adds 6 artifacts (3 for the recipe, 3 for the package).
+    """
+    run("conan new header_lib -d name=bench -d version=1.0 --force")
+    ref = json.loads(run("conan export . -f json", stderr=None))["reference"]
+    rrev = ref.split("#")[1]
+    artifactory.add_file(f"repo/_/bench/1.0/_/{rrev}/export/conan_sources.tgz", b"sources")
+
+    nodes_count = max(7, size // 6)
+    bases = [str(i) for i in range(2, 7)]
+    nodes = {"0": {"ref": "conanfile", "recipe": "Cli", "binary": None, "dependencies": {"1": {"direct": True}}}}
+    for i in range(1, nodes_count + 1):
+        package_folder = os.path.join(os.getcwd(), "packages", str(i), "p")
+        os.makedirs(package_folder)
+        for file in ("conaninfo.txt", "conanmanifest.txt", "conan_package.tgz"):
+            save(os.path.join(package_folder, file), f"{file} {i}")
+        dependencies = {} if str(i) in bases else {base: {"direct": True} for base in bases}
+        nodes[str(i)] = {"ref": ref, "id": str(i), "recipe": "Cache", "binary": "Build",
+                         "package_id": f"pkgid{i}", "prev": f"prev{i}", "package_folder": package_folder,
+                         "dependencies": dependencies}
+    save("graph.json", json.dumps({"graph": {"nodes": nodes}}))
+    return nodes_count
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_benchmark_build_info_create(size):
+    with FakeArtifactory(latency=LATENCY, error_rate=ERROR_RATE) as artifactory:
+        nodes_count = _synthetic_graph(artifactory, size)
+        _benchmark("build-info create", size, artifactory,
+                   f"conan art:build-info create graph.json bench 1 repo {_credentials(artifactory)} "
+                   f"--with-dependencies > bi.json")
+        build_info = json.loads(load("bi.json"))
+        assert len(build_info["modules"]) == 2 * nodes_count
+
+
+def _synthetic_build_info(artifactory, name, size, prefix=""):
+    modules = []
+    for i in range(max(1, size // 3)):
+        paths = [f"repo/_/{prefix}pkg{i}/1.0/_/rrev/package/pkgid/prev/{file}"
+                 for file in ("conaninfo.txt", "conanmanifest.txt", "conan_package.tgz")]
+        for path in paths:
+            artifactory.add_file(path)
+        modules.append({"type": "conan", "id": f"{prefix}pkg{i}/1.0#rrev:pkgid#prev",
+                        "artifacts": [{"name": p.split("/")[-1], "path": p, "type": "txt"} for p in paths]})
+    return {"version": "1.0.1", "name": name, "number": "1", "modules": modules}
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_benchmark_build_info_upload(size):
+    with FakeArtifactory(latency=LATENCY, error_rate=ERROR_RATE) as artifactory:
+        save("bi.json", json.dumps(_synthetic_build_info(artifactory, "bench", size)))
+        result = _benchmark("build-info upload", size, artifactory,
+                            f"conan art:build-info upload bi.json {_credentials(artifactory)} --jobs={JOBS}")
+        assert ("bench", "1") in artifactory.builds
+        if not ERROR_RATE:
+            # properties queried in bulk and patched: 1 AQL query per 100 artifacts
+            assert result["requests"] <= 1 + size // 100 + 1 + size
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_benchmark_build_info_append(size):
+    configurations = 10
+    with FakeArtifactory(latency=LATENCY, error_rate=ERROR_RATE) as artifactory:
+        args = []
+        for i in range(configurations):
+            # half of the configurations share their modules with the others
+            build_info = _synthetic_build_info(artifactory, f"bench{i}", size // configurations,
+                                               prefix="" if i % 2 else f"conf{i}")
+            if i % 2:
+                artifactory.builds[(f"bench{i}", "1")] = build_info
+                args.append(f"--build-info=bench{i},1")
+            else:
+                save(f"bi{i}.json", json.dumps(build_info))
+                args.append(f"--build-info-file=bi{i}.json")
+        _benchmark("build-info append", size, artifactory,
+                   f"conan art:build-info append bench 1 {' '.join(args)} {_credentials(artifactory)} "
+                   f"--jobs={JOBS} > aggregated.json")
+        build_info = json.loads(load("aggregated.json"))
+        assert len(build_info["modules"]) == 6 * max(1, size // configurations // 3)
+
+
+def _measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def test_benchmark_graph_loading():
+    """
+    Loading a big graph json keeping only the fields needed for the Build Info, compared with loading
+    all of it. In-process, as it does not involve the server.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "extensions", "commands", "art"))
+    from cmd_build_info import _get_node_table, _load_graph
+    from utils import load_json
+
+    # Nodes like the ones of a conan create --format=json, with their settings, options, conf and cpp_info
+    target_size = int(GRAPH_MB * 1024 * 1024)
+    with open("graph.json", "w") as graph_file:
+        graph_file.write('{"graph": {"nodes": {')
+        i = 0
+        while graph_file.tell() < target_size:
+            node = {"ref": f"pkg{i}/1.0#rrev", "id": str(i), "recipe": "Cache", "binary": "Build",
+                    "package_id": f"pkgid{i}", "prev": "prev", "package_folder": f"/conan/p/pkg{i}/p",
+                    "settings": {f"setting{j}": "value" for j in range(20)},
+                    "options": {f"option{j}": "True" for j in range(20)},
+                    "conf_info": {f"user.conf:key{j}": "value" * 10 for j in range(20)},
+                    "cpp_info": {"root": {"includedirs": [f"/conan/p/pkg{i}/p/include"] * 10,
+                                          "libs": [f"lib{j}" for j in range(50)],
+                                          "defines": [f"DEFINE_{j}=1" for j in range(50)]}},
+                    "dependencies": {str(j): {"ref": f"pkg{j}/1.0", "direct": True, "build": False,
+                                              "libs": True, "headers": True, "visible": True}
+                                     for j in range(max(0, i - 5), i)}}
+            graph_file.write(("," if i else "") + f'"{i}": ' + json.dumps(node))
+            i += 1
+        graph_file.write('}, "root": {"0": "None"}}}')
+
+    full, full_time, full_peak = _measure(lambda: load_json("graph.json"))
+    selective, selective_time, selective_peak = _measure(lambda: _load_graph("graph.json"))
+    assert len(selective["graph"]["nodes"]) == len(full["graph"]["nodes"]) == i
+    assert selective["graph"]["nodes"]["7"]["dependencies"]["3"] == {"direct": True}
+    assert selective_peak < full_peak
+    table, table_time, table_peak = _measure(lambda: _get_node_table(selective["graph"]["nodes"]))
+    assert table[7].direct_dependencies == (2, 3, 4, 5, 6)
+    assert table[7].package_path == "_/pkg7/1.0/_/rrev/package/pkgid7/prev"
+    mb = os.path.getsize("graph.json") / 1024 / 1024
+    print(f"BENCHMARK {'graph loading':<24} size={mb:.1f}MB nodes={i} "
+          f"full={full_time:.2f}s/{full_peak / 1024 / 1024:.1f}MB "
+          f"selective={selective_time:.2f}s/{selective_peak / 1024 / 1024:.1f}MB "
+          f"node table={table_time:.2f}s/{table_peak / 1024 / 1024:.1f}MB")
+    _report({"benchmark": "graph loading", "size_mb": round(mb, 1), "nodes": i,
+             "full_seconds": round(full_time, 3), "full_peak_mb": round(full_peak / 1024 / 1024, 1),
+             "selective_seconds": round(selective_time, 3),
+             "selective_peak_mb": round(selective_peak / 1024 / 1024, 1),
+             "node_table_seconds": round(table_time, 3), "node_table_peak_mb": round(table_peak / 1024 / 1024, 1)})
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_benchmark_metadata_cache(size):
+    """
+    Writing and reading the checksums of ``25 * size`` artifacts in the persistent metadata cache,
+    limited to half of what they take so the oldest ones are evicted. In-process.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "extensions", "commands", "art"))
+    from caches import MetadataCache
+    import sqlite3
+
+    count = 25 * size
+    checksums = {"md5": "c" * 32, "sha1": "b" * 40, "sha256": "a" * 64}
+    entry_size = len(json.dumps(checksums))
+    path = os.path.join(os.environ["CONAN_HOME"], "metadata.sqlite")
+    cache = MetadataCache(path, count * entry_size // 2)
+    start = time.perf_counter()
+    for i in range(count):
+        cache.set_checksums("http://server", f"repo/pkg{i}/file.tgz", checksums)
+    cache.close()
+    set_time = time.perf_counter() - start
+
+    cache = MetadataCache(path, count * entry_size // 2)
+    start = time.perf_counter()
+    found = [cache.get_checksums("http://server", f"repo/pkg{i}/file.tgz") for i in range(count)]
+    get_time = time.perf_counter() - start
+    cache.close()
+    assert found[-1] == checksums and found[0] is None
+    connection = sqlite3.connect(path)
+    stored = connection.execute("SELECT SUM(size) FROM entries").fetchone()[0]
+    connection.close()
+    assert stored <= count * entry_size // 2
+    print(f"BENCHMARK {'metadata cache':<24} entries={count:<7} set={set_time:.2f}s get={get_time:.2f}s")
+    _report({"benchmark": "metadata cache", "entries": count, "set_seconds": round(set_time, 3),
+             "get_seconds": round(get_time, 3)})
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson", "ujson"])
+def test_benchmark_json_backends(backend):
+    """
+    Parsing and compact serialization of a big Build Info with every JSON backend, that must give
+    the same output as the standard library. In-process, as it does not involve the server.
+    """
+    pytest.importorskip(backend)
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "extensions", "commands", "art"))
+    from utils import _JsonCodec
+
+    codec = _JsonCodec()
+    codec.configure(backend)
+    modules = []
+    i = 0
+    size = 0
+    while size < GRAPH_MB * 1024 * 1024:
+        ref = f"pkg{i}/1.0#rrev:pkgid{i}#prev"
+        module = {"type": "conan", "id": ref,
+                  "artifacts": [{"type": "tgz", "sha256": "a" * 64, "sha1": "b" * 40, "md5": "c" * 32,
+                                 "name": f"file{j}.tgz", "path": f"repo/_/pkg{i}/1.0/_/rrev/file{j}.tgz"}
+                                for j in range(3)],
+                  "dependencies": [{"type": "txt", "sha256": "a" * 64, "sha1": "b" * 40, "md5": "c" * 32,
+                                    "id": f"dep{j}/1.0#rrev :: conanfile.py",
+                                    "requestedBy": [[ref, "app/1.0#rrev"]]} for j in range(5)]}
+        modules.append(module)
+        size += len(json.dumps(module))
+        i += 1
+    # Not ASCII nor printable, they have to be serialized by the standard library
+    modules.append({"id": "pkgñ/1.0", "artifacts": [{"name": "a\tb/\u007f"}]})
+    build_info = {"version": "1.0.1", "name": "bench", "number": "1", "modules": modules}
+    data = json.dumps(build_info)
+
+    loaded, loads_time, _ = _measure(lambda: codec.loads(data))
+    assert loaded == build_info
+    start = time.perf_counter()
+    dumped = [codec.dumps(module, compact=True) for module in modules]
+    dumps_time = time.perf_counter() - start
+    assert dumped == [json.dumps(module, separators=(",", ":")) for module in modules]
+    # The backends write floats differently, like 1e16 or NaN (orjson writes null)
+    floats = {"id": "floats/1.0", "values": [1e16, 1e-7, 0.1, float("nan"), float("inf")]}
+    assert codec.dumps(floats, compact=True) == json.dumps(floats, separators=(",", ":"))
+    mb = len(data) / 1024 / 1024
+    print(f"BENCHMARK {'json ' + backend:<24} size={mb:.1f}MB modules={len(modules)} "
+          f"loads={loads_time:.2f}s dumps={dumps_time:.2f}s")
+    _report({"benchmark": "json", "backend": backend, "size_mb": round(mb, 1), "modules": len(modules),
+             "loads_seconds": round(loads_time, 3), "dumps_seconds": round(dumps_time, 3)})
@@ -0,0 +1,356 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+from fake_artifactory import FakeArtifactory
+from tools import load, run, save
+
+
+@pytest.fixture(autouse=True)
+def conan_test():
+    old_env = dict(os.environ)
+    conan_home = tempfile.mkdtemp(suffix='conans')
+    env_vars = {"CONAN_HOME": conan_home}
+    os.environ.update(env_vars)
+    current = tempfile.mkdtemp(suffix="conans")
+    cwd = os.getcwd()
+    os.chdir(current)
+
+    repo = os.path.join(os.path.dirname(__file__), "..")
+    run(f"conan config install {repo}")
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(old_env)
+
+
+def _add_package(artifactory, repo, ref_path, files=30):
+    for i in range(files):
+        artifactory.add_file(f"{repo}/{ref_path}/package/pkgid/prev/file{i}.txt", f"content {i}".encode())
+
+
+def test_property_add_reuses_connections():
+    """
+    All the requests of a command go through a pooled keep-alive session, so the whole
+    command only needs one connection to the server, instead of one per request
+    """
+    with FakeArtifactory() as artifactory:
+        _add_package(artifactory, "repo", "_/pkg/1.0/_/rrev")
+        credentials = f"--url={artifactory.url} --user=admin --password=password"
+
+        run(f"conan art:property add repo pkg/1.0#rrev {credentials} --property=build.name=pooled")
+        requests_issued = len(artifactory.requests)
+        assert artifactory.connections == 1
+        assert all(artifact["properties"]["build.name"] == ["pooled"]
+                   for artifact in artifactory.files.values())
+
+        # Disabling keep-alive opens one connection per request
+        save(os.path.join(os.environ["CONAN_HOME"], "global.conf"), "user.art:keep_alive=False\n")
+        artifactory.reset_stats()
+        run(f"conan art:property add repo pkg/1.0#rrev {credentials} --property=build.name=no-pool")
+        assert artifactory.connections == len(artifactory.requests) == requests_issued
+
+
+def _save_pkglist(packages):
+    revisions = {"rrev": {"timestamp": 1.0,
+                          "packages": {pkgid: {"revisions": {"prev": {"timestamp": 1.0}}, "info": {}}
+                                       for pkgid in packages}}}
+    save("pkglist.json", json.dumps({"remote": {"pkg/1.0": {"revisions": revisions}}}))
+
+
+def test_promote_jobs_same_output_as_serial():
+    with FakeArtifactory() as artifactory:
+        packages = [f"pkgid{i}" for i in range(10)]
+        for file in ("conanfile.py", "conanmanifest.txt"):
+            artifactory.add_file(f"stg/_/pkg/1.0/_/rrev/export/{file}")
+        for pkgid in packages:
+            for file in ("conan_package.tgz", "conaninfo.txt", "conanmanifest.txt"):
+                artifactory.add_file(f"stg/_/pkg/1.0/_/rrev/package/{pkgid}/prev/{file}")
+        # One of them is missing the tgz, that is allowed and reported
+        artifactory.files.pop("stg/_/pkg/1.0/_/rrev/package/pkgid3/prev/conan_package.tgz")
+        _save_pkglist(packages)
+        credentials = f"--url={artifactory.url} --user=admin --password=password"
+
+        serial = run(f"conan art:promote pkglist.json --from=stg --to=prod {credentials}")
+        concurrent = run(f"conan art:promote pkglist.json --from=stg --to=prod2 {credentials} --jobs=8")
+        assert concurrent.replace("prod2", "prod") == serial
+        assert serial.count("Promoted file") == 30
+        assert "Failed to promote _/pkg/1.0/_/rrev/package/pkgid3/prev/conan_package.tgz: " \
+               "Not found in origin, continuing..." in serial
+        assert len([p for p in artifactory.files if p.startswith("prod2/")]) == 31
+
+
+def test_promote_jobs_reports_skipped_recipes_in_order():
+    with FakeArtifactory() as artifactory:
+        for name in ("first", "second"):
+            artifactory.add_file(f"stg/_/{name}/1.0/_/rrev/export/conanfile.py")
+        revisions = {"rrev": {"timestamp": 1.0}}
+        save("pkglist.json", json.dumps({"remote": {"first/1.0": {"revisions": revisions},
+                                                    "second/1.0": {"revisions": revisions}}}))
+        credentials = f"--url={artifactory.url} --user=admin --password=password"
+
+        serial = run(f"conan art:promote pkglist.json --from=stg --to=prod {credentials}")
+        concurrent = run(f"conan art:promote pkglist.json --from=stg --to=prod2 {credentials} --jobs=8")
+        assert concurrent.replace("prod2", "prod") == serial
+        assert serial.index("Promoting _/first/1.0/_/rrev/export/") \
+               < serial.index("Recipe first/1.0#rrev does not have any package, skipping") \
+               < serial.index("Promoting _/second/1.0/_/rrev/export/") \
+               < serial.index("Recipe second/1.0#rrev does not have any package, skipping")
+
+
+def test_property_add_jobs():
+    with FakeArtifactory() as artifactory:
+        _add_package(artifactory, "repo", "_/pkg/1.0/_/rrev", files=50)
+        credentials = f"--url={artifactory.url} --user=admin --password=password"
+        save(os.path.join(os.environ["CONAN_HOME"], "global.conf"), "user.art:jobs=8\n")
+        run(f"conan art:property add repo pkg/1.0#rrev {credentials} --property=build.name=concurrent")
+        assert all(artifact["properties"]["build.name"] == ["concurrent"]
+                   for artifact in artifactory.files.values())
+        assert artifactory.connections > 1
+
+
+def test_throttled_requests_are_retried():
+    with FakeArtifactory() as artifactory:
+        _add_package(artifactory, "repo", "_/pkg/1.0/_/rrev", files=20)
+        credentials = f"--url={artifactory.url} --user=admin --password=password"
+        artifactory.throttle(3, status=503, retry_after=1)
+        start = time.perf_counter()
+        run(f"conan art:property add repo pkg/1.0#rrev {credentials} --property=build.name=retried --jobs=4")
+        assert time.perf_counter() - start > 3  # Retry-After was honored for the 3 throttled requests
+        assert all(artifact["properties"]["build.name"] == ["retried"]
+                   for artifact in artifactory.files.values())
+        assert len(artifactory.requests) == 1 + 20 * 2 + 3
+
+        # Once the retries are exhausted the error is reported
+        save(os.path.join(os.environ["CONAN_HOME"], "global.conf"), "user.art:max_retries=1\n")
+        artifactory.throttle(2, retry_after=0)
+        out = run(f"conan art:property add repo pkg/1.0#rrev {credentials} --property=build.name=retried",
+                  error=True)
+        assert "Too many requests" in out
+
+
+def test_property_add_streams_listing():
+    with FakeArtifactory() as artifactory:
+        _add_package(artifactory, "repo", "_/pkg/1.0/_/rrev", files=500)
+        # Listing uris that look like JSON syntax must not confuse the streaming parser
+        artifactory.add_file('repo/_/pkg/1.0/_/rrev/export/"files": [{}].txt')
+        credentials = f"--url={artifactory.url} --user=admin --password=password"
+        run(f"conan art:property add repo pkg/1.0#rrev {credentials} --property=build.name=streamed --jobs=8")
+        assert len(artifactory.files) == 501
+        assert all(artifact["properties"]["build.name"] == ["streamed"]
+                   for artifact in artifactory.files.values())
+
+
+def test_json_stream_small_chunks():
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "extensions", "commands", "art"))
+    from utils import _JsonStream
+
+    text = '{"uri": "/repo", "files": [-2.5, 1e-3, 12, 0.5E+10, -7, true, null, "3.5", [1.25e2, -0.0],' \
+           ' {"size": -1.5e-2, "folder": false}, 4.75E-1], "other": {"a": 1, "b": -2.5e+3, "c": [1, 2.5]}}'
+    for data in (text, json.dumps(json.loads(text), indent=2)):
+        data = data.encode("utf-8")
+        for chunk_size in (1, 2, 3):
+            chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+            assert list(_JsonStream(chunks, "files")) == json.loads(data)["files"]
+            assert dict(_JsonStream(chunks, "other")) == json.loads(data)["other"]
+
+
+def test_executor_stops_at_first_error():
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "extensions", "commands", "art"))
+    from utils import RequestExecutor
+
+    called = []
+
+    def _task(item):
+        called.append(item)
+        if item == 3:
+            raise ValueError("failed")
+        time.sleep(0.05)
+        return item
+
+    results = RequestExecutor(jobs=4).run(_task, range(100))
+    assert [result for result, _ in results] == [0, 1, 2, None]
+    assert str(results[-1][1]) == "failed"
+    # The tasks already queued when the error happened, not the remaining ones
+    assert len(called) < 20
+
+
+def test_trace_http():
+    with FakeArtifactory() as artifactory:
+        _add_package(artifactory, "repo", "_/pkg/1.0/_/rrev", files=10)
+        credentials = f"--url={artifactory.url} --user=admin --password=password"
+        artifactory.throttle(1, retry_after=0)
+        out = run(f"conan art:property add repo pkg/1.0#rrev {credentials} --property=build.name=traced "
+                  f"--trace-http=trace.json")
+        assert "HTTP trace with 22 requests saved to" in out
+        assert "(0 duplicated requests coalesced)" in out
+        assert "PATCH api/metadata/*?recursiveProperties" in out
+
+        trace = json.loads(load("trace.json"))
+        requests = [e for e in trace["traceEvents"] if e["cat"] == "http"]
+        assert len(requests) == 22
+        listing = [e for e in requests if e["name"] == "GET api/storage/*?list&deep&listFolders"]
+        assert [e["args"]["status"] for e in listing] == [429, 200]
+        assert listing[1]["args"]["attempt"] == 1
+        summary = {row["endpoint"]: row for row in trace["summary"]}
+        assert summary["GET api/storage/*?properties"]["requests"] == 10
+        assert summary["GET api/storage/*?properties"]["errors"] == 10  # 404, no properties yet
+        assert summary["PATCH api/metadata/*?recursiveProperties"]["sent"] > 0
+
+
+def test_concurrent_duplicated_requests_are_coalesced():
+    with FakeArtifactory() as artifactory:
+        run("conan new header_lib -d name=pkg -d version=1.0")
+        ref = json.loads(run("conan export . -f json", stderr=None))["reference"]
+        artifactory.add_file(f"repo/_/pkg/1.0/_/{ref.split('#')[1]}/export/conan_sources.tgz", b"sources")
+        # All the nodes share the recipe, its sources are requested to Artifactory at the same time
+        nodes = {"0": {"ref": "conanfile", "recipe": "Cli", "binary": None, "dependencies": {}}}
+        for i in range(1, 11):
+            package_folder = os.path.join(os.getcwd(), "packages", str(i), "p")
+            os.makedirs(package_folder)
+            for file in ("conaninfo.txt", "conanmanifest.txt", "conan_package.tgz"):
+                save(os.path.join(package_folder, file), f"{file} {i}")
+            nodes[str(i)] = {"ref": ref, "id": str(i), "recipe": "Cache", "binary": "Build",
+                             "package_id": f"pkgid{i}", "prev": "prev", "package_folder": package_folder,
+                             "dependencies": {}}
+        save("graph.json", json.dumps({"graph": {"nodes": nodes}}))
+        artifactory.latency = 0.2
+        run(f"conan art:build-info create graph.json bi 1 repo --url={artifactory.url} --user=admin "
+            f"--password=password --jobs=10 -v > bi.json")
+        # build-info create only requests them once
+        assert [r for r in artifactory.requests if r[0] == "GET"] == \
+               [("GET", f"/artifactory/api/storage/repo/_/pkg/1.0/_/{ref.split('#')[1]}/export/conan_sources.tgz")]
+        assert len(json.loads(load("bi.json"))["modules"]) == 20
+
+        # The same build requested several times at once
+        artifactory.builds[("bi", "1")] = json.loads(load("bi.json"))
+        artifactory.reset_stats()
+        out = run(f"conan art:build-info append all 1 {' --build-info=bi,1' * 10} --url={artifactory.url} "
+                  f"--user=admin --password=password --jobs=10 -v")
+        get_requests = [r for r in artifactory.requests if r[0] == "GET"]
+        coalesced = 10 - len(get_requests)
+        assert coalesced > 0
+        assert f"{coalesced} duplicated concurrent requests to Artifactory were coalesced" in out
+
+
+def test_build_info_upload_sets_properties_in_bulk():
+    with FakeArtifactory() as artifactory:
+        _add_package(artifactory, "repo", "_/pkg/1.0/_/rrev", files=5)
+        paths = list(artifactory.files)
+        artifactory.files[paths[0]]["properties"].update({"build.name": ["bi"], "build.number": ["1"]})
+        artifactory.files[paths[1]]["properties"].update({"build.name": ["other"], "build.number": ["1"]})
+        artifacts = [{"name": path.split("/")[-1], "path": path} for path in paths]
+        # Both modules share the same artifacts
+        build_info = {"name": "bi", "number": "1",
+                      "modules": [{"id": "pkg/1.0#rrev", "artifacts": artifacts},
+                                  {"id": "pkg/1.0#rrev:pkgid#prev", "artifacts": artifacts}]}
+        save("bi.json", json.dumps(build_info))
+        out = run(f"conan art:build-info upload bi.json --url={artifactory.url} --user=admin --password=password "
+                  f"--jobs=4 -v --profile-report=profile.json")
+        assert sorted(artifactory.requests) == [("PATCH", f"/artifactory/api/metadata/{path}?&recursiveProperties=0")
+                                                for path in sorted(paths[1:])] + \
+               [("POST", "/artifactory/api/search/aql"), ("PUT", "/artifactory/api/build")]
+        assert "Build properties set to 4 of 5 artifacts with 5 requests to Artifactory (5 requests saved)" in out
+        phases = {phase["phase"]: phase["http_requests"] for phase in json.loads(load("profile.json"))["phases"]}
+        assert phases == {"load build info": 0, "query properties": 1, "set properties": 4, "upload build info": 1}
+        assert artifactory.files[paths[1]]["properties"] == {"build.name": ["other", "bi"], "build.number": ["1"]}
+        assert all(artifactory.files[path]["properties"] == {"build.name": ["bi"], "build.number": ["1"]}
+                   for path in paths[:1] + paths[2:])
+
+
+def test_build_info_upload_properties_not_found_in_bulk():
+    with FakeArtifactory() as artifactory:
+        # AQL does not find the files of virtual repositories, their properties are requested one by one
+        artifactory.virtual_repos.add("virtual")
+        _add_package(artifactory, "repo", "_/pkg/1.0/_/rrev", files=1)
+        _add_package(artifactory, "virtual", "_/pkg/1.0/_/rrev", files=1)
+        virtual_path, repo_path = sorted(artifactory.files)[::-1]
+        artifactory.files[virtual_path]["properties"].update({"build.name": ["other"], "build.number": ["7"]})
+        artifacts = [{"name": path.split("/")[-1], "path": path} for path in (repo_path, virtual_path)]
+        save("bi.json", json.dumps({"name": "bi", "number": "1",
+                                    "modules": [{"id": "pkg/1.0#rrev", "artifacts": artifacts}]}))
+        run(f"conan art:build-info upload bi.json --url={artifactory.url} --user=admin --password=password")
+        assert ("GET", f"/artifactory/api/storage/{virtual_path}?properties") in artifactory.requests
+        assert ("GET", f"/artifactory/api/storage/{repo_path}?properties") not in artifactory.requests
+        assert artifactory.files[virtual_path]["properties"] == {"build.name": ["other", "bi"],
+                                                                 "build.number": ["7", "1"]}
+        assert artifactory.files[repo_path]["properties"] == {"build.name": ["bi"], "build.number": ["1"]}
+
+
+def test_build_info_append_jobs_same_output_as_serial():
+    with FakeArtifactory() as artifactory:
+        args = []
+        for i in range(8):
+            # the recipe module is shared by all the builds
+            modules = [{"id": "pkg/1.0#rrev", "artifacts": [], "build": str(i)},
+                       {"id": f"pkg/1.0#rrev:pkgid{i}#prev", "artifacts": []},
+                       {"id": f"pkg/1.0#rrev:pkgid{i % 2}#prev", "artifacts": []}]
+            artifactory.builds[(f"bi{i}", "1")] = {"name": f"bi{i}", "number": "1", "modules": modules}
+            args.append(f"--build-info=bi{i},1")
+        save("bi.json", json.dumps({"name": "local", "number": "1", "modules": [{"id": "local/1.0#rrev"}]}))
+        append_cmd = f"conan art:build-info append all 1 {' '.join(args)} --build-info-file=bi.json " \
+                     f"--url={artifactory.url} --user=admin --password=password"
+        artifactory.latency = 0.1
+        run(f"{append_cmd} > serial.json")
+        run(f"{append_cmd} --jobs=8 > concurrent.json")
+
+    modules = json.loads(load("serial.json"))["modules"]
+    assert json.loads(load("concurrent.json"))["modules"] == modules
+    assert [m["id"] for m in modules] == ["pkg/1.0#rrev", "pkg/1.0#rrev:pkgid0#prev"] + \
+           [f"pkg/1.0#rrev:pkgid{i}#prev" for i in range(1, 8)] + ["local/1.0#rrev"]
+    assert modules[0]["build"] == "0"
+
+
+def test_compressed_build_info_transfer():
+    with FakeArtifactory() as artifactory:
+        modules = [{"id": f"pkg{i}/1.0#rrev", "artifacts": []} for i in range(500)]
+        save("bi.json", json.dumps({"name": "bi", "number": "1", "modules": modules}, indent=4))
+        credentials = f"--url={artifactory.url} --user=admin --password=password"
+
+        run(f"conan art:build-info upload bi.json {credentials}")
+        uncompressed = artifactory.received_bytes
+        artifactory.reset_stats()
+        run(f"conan art:build-info upload bi.json {credentials} --compress --trace-http=upload.json")
+        assert artifactory.builds[("bi", "1")]["modules"] == modules
+        assert artifactory.received_bytes < uncompressed / 5
+        summary = {row["endpoint"]: row for row in json.loads(load("upload.json"))["summary"]}
+        assert summary["PUT api/build"]["sent"] == artifactory.received_bytes
+        assert summary["PUT api/build"]["saved"] == uncompressed - artifactory.received_bytes
+
+        # responses are also compressed
+        run(f"conan art:build-info get bi 1 {credentials} --trace-http=get.json > downloaded.json")
+        assert json.loads(load("downloaded.json"))["buildInfo"]["modules"] == modules
+        summary = {row["endpoint"]: row for row in json.loads(load("get.json"))["summary"]}
+        assert summary["GET api/build/*"]["saved"] > summary["GET api/build/*"]["received"]
+
+
+def test_access_token_auth():
+    with FakeArtifactory() as artifactory:
+        _add_package(artifactory, "repo", "_/pkg/1.0/_/rrev", files=10)
+        run(f"conan art:server add myart {artifactory.url} --user=admin --password=password --access-token "
+            f"--token-expires-in=3")
+        assert ("POST", "/access/api/v1/tokens") in artifactory.requests
+        assert "access token: *******" in run("conan art:server list")
+
+        artifactory.reset_stats()
+        run("conan art:property add repo pkg/1.0#rrev --server=myart --property=build.name=bearer")
+        assert set(artifactory.authorizations) == {"Bearer"}
+        assert all(artifact["properties"]["build.name"] == ["bearer"] for artifact in artifactory.files.values())
+
+        # The token is refreshed before it expires, and the new one is stored for the next commands
+        time.sleep(3)
+        artifactory.reset_stats()
+        out = run("conan art:property add repo pkg/1.0#rrev --server=myart --property=build.name=refreshed -v")
+        assert "Access token for" in out and "refreshed" in out
+        assert artifactory.requests.count(("POST", "/access/api/v1/tokens")) == 1
+        assert artifactory.authorizations.count("Bearer") == len(artifactory.requests) - 1
+        artifactory.reset_stats()
+        run("conan art:property add repo pkg/1.0#rrev --server=myart --property=build.name=stored")
+        assert ("POST", "/access/api/v1/tokens") not in artifactory.requests
+        assert set(artifactory.authorizations) == {"Bearer"}
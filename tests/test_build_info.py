@@ -1,12 +1,15 @@
+import hashlib
 import json
 import tempfile
 import textwrap
 import os
 import datetime
 import re
+import time
 
 import pytest
 
+from fake_artifactory import FakeArtifactory
 from tools import load, save, run
 
 
@@ -214,3 +217,396 @@ def test_missing_files_warning():
 
     out = run("conan art:build-info create create.json build_name 1 repo --with-dependencies > bi.json")
     assert not "WARN: There are missing .tgz files" in out
+
+
+def test_create_invalid_graph_json():
+    run("conan new header_lib -d name=lib1 -d version=1.0")
+    run("conan create . -tf='' -f json > create.json")
+    content = load("create.json")
+    save("truncated.json", content[:len(content) // 2])
+    with open("latin1.json", "wb") as f:
+        f.write(content.replace('"graph"', '"graph\xe9"', 1).encode("latin-1"))
+    for json_file in ("truncated.json", "latin1.json"):
+        out = run(f"conan art:build-info create create.json build_name 1 repo --json-file={json_file}", error=True)
+        assert f"ERROR: Error: The file {json_file} is not a valid JSON file." in out
+        assert "Traceback" not in out
+
+
+def test_remote_checksums_persistent_cache():
+    """
+    Checksums of revisioned artifacts retrieved from Artifactory are cached in the Conan home
+    and reused by the next build-info create, only the requests that failed are repeated
+    """
+    run("conan new header_lib -d name=lib1 -d version=1.0")
+    run("conan create . -tf='' -f json > create.json")
+    graph = json.loads(load("create.json"))["graph"]
+    rrev = graph["nodes"]["1"]["ref"].split("#")[1]
+
+    with FakeArtifactory() as artifactory:
+        artifactory.add_file(f"repo2/_/lib1/1.0/_/{rrev}/export/conanmanifest.txt")
+        artifactory.add_file(f"repo2/_/lib1/1.0/_/{rrev}/export/conan_sources.tgz", b"sources")
+        create_cmd = f"conan art:build-info create create.json build_name 1 repo1 repo2 " \
+                     f"--url={artifactory.url} --user=admin --password=password -v"
+
+        run(f"{create_cmd} > bi.json")
+        # the origin search in repo1 and repo2 and the conan_sources.tgz checksums
+        assert [method for method, _ in artifactory.requests] == ["POST", "GET"]
+        build_info = json.loads(load("bi.json"))
+        sources = [a for a in build_info["modules"][0]["artifacts"] if a["name"] == "conan_sources.tgz"]
+        assert sources[0]["sha1"] == artifactory.files[f"repo2/_/lib1/1.0/_/{rrev}/export/conan_sources.tgz"]["checksums"]["sha1"]
+
+        artifactory.reset_stats()
+        out = run(f"{create_cmd} > bi2.json")
+        # repo1 has higher priority and not found results are not cached, the origin has to be searched again
+        assert artifactory.requests == [("POST", "/artifactory/api/search/aql")]
+        assert "Artifactory metadata cache: 1 hits, 0 misses" in out
+        assert json.loads(load("bi2.json"))["modules"] == build_info["modules"]
+
+        run("conan art:server clean-cache")
+        artifactory.reset_stats()
+        run(f"{create_cmd} > bi.json")
+        assert len(artifactory.requests) == 2
+
+
+def test_create_jobs_same_output_as_serial():
+    for i in range(5):
+        requires = f"-d requires=lib{i - 1}/1.0" if i else ""
+        run(f"conan new header_lib -d name=lib{i} -d version=1.0 {requires} --force")
+        run("conan export .")
+    run("conan new header_lib -d name=app -d version=1.0 -d requires=lib4/1.0 -d requires=lib2/1.0 --force")
+    run("conan create . -tf='' --build=* -f json > create.json")
+
+    # Not using the cached checksums, so both runs request the same to the server
+    save(os.path.join(os.environ["CONAN_HOME"], "global.conf"),
+         "user.art:metadata_cache=False\nuser.art:checksum_cache_min_size=0\n")
+    with FakeArtifactory(latency=0.05) as artifactory:
+        create_cmd = f"conan art:build-info create create.json build_name 1 repo1 repo2 --with-dependencies " \
+                     f"--url={artifactory.url} --user=admin --password=password"
+        for node in json.loads(load("create.json"))["graph"]["nodes"].values():
+            if node["recipe"] == "Cache":
+                name_version, rrev = node["ref"].split("#")
+                artifactory.add_file(f"repo2/_/{name_version}/_/{rrev}/export/conanmanifest.txt")
+        out = run(f"{create_cmd} -v > serial.json")
+        # every file is hashed only once, even if it is a dependency of several modules
+        assert "Local checksums cache: 0 hits, 24 misses" in out
+        run(f"{create_cmd} --jobs=8 > concurrent.json")
+
+    serial = json.loads(load("serial.json"))
+    concurrent = json.loads(load("concurrent.json"))
+    assert len(serial["modules"]) == 12
+    serial.pop("started"), concurrent.pop("started")
+    assert json.dumps(concurrent, indent=4) == json.dumps(serial, indent=4)
+
+    # requestedBy has all the paths of direct requirements up to the root
+    app_recipe, app_package = serial["modules"][:2]
+    assert app_recipe["id"].startswith("app/1.0#")
+    lib0 = [d for d in app_recipe["dependencies"] if d["id"].startswith("lib0/1.0#")]
+    requested_by = [[ref.split("/")[0] for ref in path] for path in lib0[0]["requestedBy"]]
+    assert requested_by == [["lib1", "lib2", "app"], ["lib1", "lib2", "lib3", "lib4", "app"]]
+    lib4 = [d for d in app_package["dependencies"] if d["id"].startswith("lib4/1.0#")]
+    assert lib4[0]["requestedBy"] == [[app_package["id"]]]
+
+
+def test_create_requested_by_max_paths():
+    run("conan new header_lib -d name=lib0 -d version=1.0 --force")
+    run("conan export .")
+    for name in ("lib1", "lib2"):
+        run(f"conan new header_lib -d name={name} -d version=1.0 -d requires=lib0/1.0 --force")
+        run("conan export .")
+    run("conan new header_lib -d name=app -d version=1.0 -d requires=lib1/1.0 -d requires=lib2/1.0 --force")
+    run("conan create . -tf='' --build=* -f json > create.json")
+
+    with FakeArtifactory() as artifactory:
+        create_cmd = f"conan art:build-info create create.json build_name 1 repo --with-dependencies -v " \
+                     f"--url={artifactory.url} --user=admin --password=password"
+        out = run(f"{create_cmd} > bi.json")
+        assert "requestedBy" not in out
+        save(os.path.join(os.environ["CONAN_HOME"], "global.conf"), "user.art:requested_by_max_paths=1\n")
+        out = run(f"{create_cmd} > bi_truncated.json")
+        assert "WARN: Some dependencies have more than 1 paths to the root of the graph" in out
+        assert out.count("requestedBy of lib0/1.0#") == 1
+
+    def _lib0_requested_by(build_info):
+        app_recipe = json.loads(load(build_info))["modules"][0]
+        return [d["requestedBy"] for d in app_recipe["dependencies"] if d["id"].startswith("lib0/1.0#")][0]
+    assert len(_lib0_requested_by("bi.json")) == 2
+    assert len(_lib0_requested_by("bi_truncated.json")) == 1
+
+
+def test_local_checksums_persistent_cache():
+    run("conan new header_lib -d name=lib1 -d version=1.0")
+    run("conan create . -tf='' -f json > create.json")
+    package_folder = json.loads(load("create.json"))["graph"]["nodes"]["1"]["package_folder"]
+
+    with FakeArtifactory() as artifactory:
+        create_cmd = f"conan art:build-info create create.json build_name 1 repo -v " \
+                     f"--url={artifactory.url} --user=admin --password=password"
+        # By default, small files are hashed without looking them up in the cache
+        out = run(f"{create_cmd} > bi.json")
+        assert "Local checksums cache" not in out
+
+        save(os.path.join(os.environ["CONAN_HOME"], "global.conf"), "user.art:checksum_cache_min_size=0\n")
+        out = run(f"{create_cmd} > bi.json")
+        # conanfile.py, conanmanifest.txt, conaninfo.txt and conanmanifest.txt
+        assert "Local checksums cache: 0 hits, 4 misses" in out
+        out = run(f"{create_cmd} > bi2.json")
+        assert "Local checksums cache: 4 hits, 0 misses (100.0% hit rate)" in out
+        assert json.loads(load("bi2.json"))["modules"] == json.loads(load("bi.json"))["modules"]
+
+        # Modified files are hashed again
+        with open(os.path.join(package_folder, "conaninfo.txt"), "a") as f:
+            f.write("\n")
+        out = run(f"{create_cmd} > bi3.json")
+        assert "Local checksums cache: 3 hits, 1 misses" in out
+
+    def _conaninfo(build_info):
+        return [a for a in build_info["modules"][1]["artifacts"] if a["name"] == "conaninfo.txt"][0]
+    assert _conaninfo(json.loads(load("bi3.json")))["sha1"] != _conaninfo(json.loads(load("bi.json")))["sha1"]
+
+
+def test_checksums_from_server():
+    run("conan new header_lib -d name=lib1 -d version=1.0")
+    run("conan create . -tf='' -f json > create.json")
+    node = json.loads(load("create.json"))["graph"]["nodes"]["1"]
+    recipe_path = f"_/lib1/1.0/_/{node['ref'].split('#')[1]}/export"
+    package_path = f"_/lib1/1.0/_/{node['ref'].split('#')[1]}/package/{node['package_id']}/{node['prev']}"
+
+    save(os.path.join(os.environ["CONAN_HOME"], "global.conf"), "user.art:checksum_cache_min_size=0\n")
+    with FakeArtifactory() as artifactory:
+        for file in ("conanfile.py", "conanmanifest.txt", "conan_sources.tgz"):
+            artifactory.add_file(f"repo2/{recipe_path}/{file}", f"remote {file}".encode())
+        # conaninfo.txt is not in the server, it is hashed locally
+        for file in ("conan_package.tgz", "conanmanifest.txt"):
+            artifactory.add_file(f"repo2/{package_path}/{file}", f"remote {file}".encode())
+        out = run(f"conan art:build-info create create.json build_name 1 repo1 repo2 --checksums-from=server -v "
+                  f"--url={artifactory.url} --user=admin --password=password > bi.json")
+        assert artifactory.requests == [("POST", "/artifactory/api/search/aql")]
+        assert "2 paths searched in Artifactory with 1 AQL queries" in out
+        assert "Local checksums cache: 0 hits, 1 misses" in out
+
+        recipe, package = json.loads(load("bi.json"))["modules"]
+        assert [a["name"] for a in recipe["artifacts"]] == ["conanfile.py", "conanmanifest.txt", "conan_sources.tgz"]
+        assert [a["name"] for a in package["artifacts"]] == ["conan_package.tgz", "conanmanifest.txt",
+                                                             "conaninfo.txt"]
+        for artifact in recipe["artifacts"] + package["artifacts"][:2]:
+            assert artifact["sha1"] == artifactory.files[artifact["path"]]["checksums"]["sha1"]
+        with open(os.path.join(node["package_folder"], "conaninfo.txt"), "rb") as f:
+            assert package["artifacts"][2]["sha1"] == hashlib.sha1(f.read()).hexdigest()
+
+
+def test_checksums_from_server_virtual_repository():
+    run("conan new header_lib -d name=lib1 -d version=1.0")
+    run("conan create . -tf='' -f json > create.json")
+    node = json.loads(load("create.json"))["graph"]["nodes"]["1"]
+    recipe_path = f"_/lib1/1.0/_/{node['ref'].split('#')[1]}/export"
+
+    with FakeArtifactory() as artifactory:
+        # AQL does not find the files of virtual repositories, they are collected like with local checksums
+        artifactory.virtual_repos.add("repo2")
+        for file in ("conanmanifest.txt", "conan_sources.tgz"):
+            artifactory.add_file(f"repo2/{recipe_path}/{file}", f"remote {file}".encode())
+        run(f"conan art:build-info create create.json build_name 1 repo1 repo2 --checksums-from=server "
+            f"--url={artifactory.url} --user=admin --password=password > bi.json")
+
+    recipe = json.loads(load("bi.json"))["modules"][0]
+    assert [a["name"] for a in recipe["artifacts"]] == ["conanfile.py", "conanmanifest.txt", "conan_sources.tgz"]
+    assert recipe["artifacts"][2]["sha1"] == \
+           artifactory.files[f"repo2/{recipe_path}/conan_sources.tgz"]["checksums"]["sha1"]
+
+
+def test_origin_repos_searched_in_bulk():
+    for i in range(3):
+        run(f"conan new header_lib -d name=lib{i} -d version=1.0 --force")
+        run("conan export .")
+    run("conan new header_lib -d name=app -d version=1.0 -d requires=lib0/1.0 -d requires=lib1/1.0 "
+        "-d requires=lib2/1.0 --force")
+    run("conan create . -tf='' --build=* -f json > create.json")
+
+    with FakeArtifactory() as artifactory:
+        origins = {"app": "repo3", "lib0": "repo1", "lib1": "repo2", "lib2": "repo3"}
+        for node in json.loads(load("create.json"))["graph"]["nodes"].values():
+            if node["recipe"] == "Cache":
+                name_version, rrev = node["ref"].split("#")
+                repo = origins[name_version.split("/")[0]]
+                # lib0 is in all the repositories, the first one has priority
+                for r in (["repo3", "repo2", "repo1"] if repo == "repo1" else [repo]):
+                    artifactory.add_file(f"{r}/_/{name_version}/_/{rrev}/export/conanmanifest.txt")
+        run(f"conan art:build-info create create.json build_name 1 repo1 repo2 repo3 --with-dependencies "
+            f"--url={artifactory.url} --user=admin --password=password > bi.json")
+        # a single search, instead of probing every reference in every repository, and the sources
+        assert [r for r in artifactory.requests if "conanmanifest.txt" in r[1]] == []
+        assert artifactory.requests.count(("POST", "/artifactory/api/search/aql")) == 1
+
+    for module in json.loads(load("bi.json"))["modules"]:
+        name = module["id"].split("/")[0]
+        assert all(a["path"].startswith(f"{origins[name]}/") for a in module["artifacts"])
+
+
+def test_origin_repos_not_found_in_bulk():
+    run("conan new header_lib -d name=lib1 -d version=1.0")
+    run("conan create . -tf='' -f json > create.json")
+    _fake_conan_sources(json.loads(load("create.json"))["graph"])
+    node = json.loads(load("create.json"))["graph"]["nodes"]["1"]
+    name_version, rrev = node["ref"].split("#")
+
+    with FakeArtifactory() as artifactory:
+        # AQL does not find the files of virtual repositories, they are probed with the storage API
+        artifactory.virtual_repos.add("repo2")
+        artifactory.add_file(f"repo2/_/{name_version}/_/{rrev}/export/conanmanifest.txt")
+        run(f"conan art:build-info create create.json build_name 1 repo1 repo2 "
+            f"--url={artifactory.url} --user=admin --password=password > bi.json")
+        assert artifactory.requests.count(("POST", "/artifactory/api/search/aql")) == 1
+
+    for module in json.loads(load("bi.json"))["modules"]:
+        assert all(a["path"].startswith("repo2/") for a in module["artifacts"])
+
+
+def test_create_stream():
+    run("conan new header_lib -d name=lib1 -d version=1.0")
+    run("conan export .")
+    run("conan new header_lib -d name=app -d version=1.0 -d requires=lib1/1.0 --force")
+    run("conan create . -tf='' --build=* -f json > create.json")
+
+    with FakeArtifactory() as artifactory:
+        create_cmd = f"conan art:build-info create create.json build_name 1 repo --with-dependencies " \
+                     f"--url={artifactory.url} --user=admin --password=password"
+        run(f"{create_cmd} > bi.json")
+        run(f"{create_cmd} --stream > streamed.json")
+        run(f"{create_cmd} --stream --compact --out-file=compact.json")
+
+    expected = load("bi.json")
+    streamed = load("streamed.json")
+    started = json.loads(streamed)["started"]
+    assert streamed == re.sub(r'"started": "[^"]*"', f'"started": "{started}"', expected)
+    compact = load("compact.json")
+    assert "\n" not in compact.strip() and ", " not in compact
+    assert json.loads(compact)["modules"] == json.loads(expected)["modules"]
+    assert len(json.loads(compact)["modules"]) == 4
+
+
+def test_create_several_graphs():
+    conanfile = textwrap.dedent("""
+        from conan import ConanFile
+        class Pkg(ConanFile):
+            name = "{name}"
+            version = "1.0"
+            settings = "build_type"
+            {requires}
+        """)
+    save("conanfile.py", conanfile.format(name="lib1", requires=""))
+    run("conan export .")
+    save("conanfile.py", conanfile.format(name="app", requires="requires = 'lib1/1.0'"))
+    for build_type in ("Release", "Debug"):
+        run(f"conan create . -s build_type={build_type} --build=* -f json > {build_type}.json")
+        _fake_conan_sources(json.loads(load(f"{build_type}.json"))["graph"])
+
+    save(os.path.join(os.environ["CONAN_HOME"], "global.conf"), "user.art:checksum_cache_min_size=0\n")
+    with FakeArtifactory() as artifactory:
+        credentials = f"--url={artifactory.url} --user=admin --password=password"
+        out = run(f"conan art:build-info create Release.json build_name 1 repo --json-file=Debug.json "
+                  f"--with-dependencies -v {credentials} > bi.json")
+        # 2 recipes with 3 files and 4 packages with 2 files, each of them hashed only once
+        assert "Local checksums cache: 0 hits, 14 misses" in out
+        for build_type in ("Release", "Debug"):
+            run(f"conan art:build-info create {build_type}.json build_name 1 repo --with-dependencies "
+                f"{credentials} > {build_type}_bi.json")
+        run("conan art:build-info append build_name 1 --build-info-file=Release_bi.json "
+            "--build-info-file=Debug_bi.json > appended.json")
+
+    modules = json.loads(load("bi.json"))["modules"]
+    assert [m["id"].split("#")[0] for m in modules] == ["app/1.0", "app/1.0", "lib1/1.0", "lib1/1.0",
+                                                        "app/1.0", "lib1/1.0"]
+    assert len(set(m["id"] for m in modules)) == 6
+    assert modules == json.loads(load("appended.json"))["modules"]
+
+
+def test_create_reusing_previous_build_info():
+    run("conan new header_lib -d name=lib1 -d version=1.0")
+    run("conan export .")
+    run("conan new header_lib -d name=app -d version=1.0 -d requires=lib1/1.0 --force")
+    run("conan create . -tf='' --build=* -f json > create.json")
+    _fake_conan_sources(json.loads(load("create.json"))["graph"])
+    lib1 = [n for n in json.loads(load("create.json"))["graph"]["nodes"].values() if n["ref"].startswith("lib1")][0]
+
+    with FakeArtifactory() as artifactory:
+        create_cmd = f"conan art:build-info create create.json build_name 1 repo --with-dependencies -v " \
+                     f"--url={artifactory.url} --user=admin --password=password"
+        run(f"{create_cmd} > bi.json")
+        out = run(f"{create_cmd} --previous=bi.json > bi2.json")
+        assert "Artifacts of 4 recipes and packages reused from the previous Build Info" in out
+        assert "Local checksums cache" not in out  # nothing hashed
+        assert json.loads(load("bi2.json"))["modules"] == json.loads(load("bi.json"))["modules"]
+
+        # The files modified after the previous Build Info are collected again
+        previous = json.loads(load("bi.json"))
+        for module in previous["modules"]:
+            for artifact in module["artifacts"]:
+                artifact["sha1"] = "previous"
+        save("previous.json", json.dumps(previous))
+        future = time.time() + 10
+        os.utime(os.path.join(lib1["package_folder"], "conaninfo.txt"), (future, future))
+        out = run(f"{create_cmd} --previous=previous.json > bi3.json")
+        assert "Artifacts of 3 recipes and packages reused from the previous Build Info" in out
+        modules = {module["id"]: module for module in json.loads(load("bi3.json"))["modules"]}
+        lib1_package = modules[f"{lib1['ref']}:{lib1['package_id']}#{lib1['prev']}"]
+        assert all(artifact["sha1"] != "previous" for artifact in lib1_package["artifacts"])
+        app_package = [module for id_, module in modules.items() if id_.startswith("app") and ":" in id_][0]
+        assert all(artifact["sha1"] == "previous" for artifact in app_package["artifacts"])
+        assert [d["sha1"] for d in app_package["dependencies"]] == \
+               [a["sha1"] for a in lib1_package["artifacts"]]
+
+
+def test_create_previous_build_info_missing_new_files():
+    run("conan new header_lib -d name=lib1 -d version=1.0")
+    run("conan create . -tf='' -f json > create.json")
+    node = json.loads(load("create.json"))["graph"]["nodes"]["1"]
+
+    with FakeArtifactory() as artifactory:
+        create_cmd = f"conan art:build-info create create.json build_name 1 repo -v " \
+                     f"--url={artifactory.url} --user=admin --password=password"
+        run(f"{create_cmd} > bi.json")
+        recipe, package = json.loads(load("bi.json"))["modules"]
+        assert "conan_sources.tgz" not in [a["name"] for a in recipe["artifacts"]]
+        assert "conan_package.tgz" not in [a["name"] for a in package["artifacts"]]
+
+        # The .tgz files appear later in the cache, like after a conan upload, even if older
+        past = time.time() - 3600
+        for folder, name in ((node["recipe_folder"], "conan_sources.tgz"),
+                             (node["package_folder"], "conan_package.tgz")):
+            tgz_path = os.path.join(os.path.dirname(folder), "d", name)
+            save(tgz_path, "")
+            os.utime(tgz_path, (past, past))
+        out = run(f"{create_cmd} --previous=bi.json > bi2.json")
+        assert "Artifacts of 0 recipes and packages reused from the previous Build Info" in out
+        recipe, package = json.loads(load("bi2.json"))["modules"]
+        assert "conan_sources.tgz" in [a["name"] for a in recipe["artifacts"]]
+        assert "conan_package.tgz" in [a["name"] for a in package["artifacts"]]
+
+
+def test_create_profile_report():
+    run("conan new header_lib -d name=lib1 -d version=1.0")
+    run("conan export .")
+    run("conan new header_lib -d name=app -d version=1.0 -d requires=lib1/1.0 --force")
+    run("conan create . -tf='' --build=* -f json > create.json")
+
+    with FakeArtifactory() as artifactory:
+        out = run(f"conan art:build-info create create.json build_name 1 repo --with-dependencies --jobs=2 "
+                  f"--url={artifactory.url} --user=admin --password=password --profile-report=profile.json "
+                  f"> bi.json")
+    assert "Profile report saved to" in out
+
+    report = json.loads(load("profile.json"))
+    phases = {phase["phase"]: phase for phase in report["phases"]}
+    assert list(phases) == ["load graph", "node table", "requested by index", "artifacts", "serialization"]
+    assert phases["artifacts"]["calls"] == 5  # 4 modules, and the end of them
+    assert phases["serialization"]["calls"] == 4
+    assert all(phase["peak_memory"] > 0 for phase in phases.values())
+    # conan_sources.tgz of the 2 recipes is not in the cache, it is requested to Artifactory
+    assert report["http_requests"] == phases["artifacts"]["http_requests"] == 2
+    assert report["hashed_bytes"] == phases["artifacts"]["hashed_bytes"] > 0
+    assert {step["step"] for step in report["steps"]} == {"origin lookup", "export folder", "list files",
+                                                         "hashing", "remote checksums"}
+    nodes = {node["node"].split("/")[0]: node for node in report["nodes"]}
+    assert set(nodes) == {"app", "lib1"}
+    assert nodes["app"]["hashed_bytes"] + nodes["lib1"]["hashed_bytes"] == report["hashed_bytes"]
+    assert nodes["app"]["steps"]["hashing"] > 0